@@ -4,8 +4,10 @@ from .sysid.model import Model
 from .system import System
 from .control.controller import Controller
 from .trajectory import Trajectory, zeros, empty, extend
+from .trajectory_set import TrajectorySet, save_trajectory_set, load_trajectory_set
 from .tasks import Task
-from .utils import make_model, make_controller, simulate
+from .utils import (make_model, make_controller, simulate, simulate_batch,
+        simulate_parallel)
 from .pipeline import Pipeline
 
 print("Finished loading AutoMPC")
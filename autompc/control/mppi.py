@@ -126,26 +126,24 @@ class MPPI(Controller):
         eps = self.noise_dist.sample((self.num_path, self.H)).transpose((1, 0, 2))
         # path = np.zeros((self.H + 1, self.num_path, self.dim_state))  # horizon by num_path by state_dim
         # path[0] = cur_state  # just copy the initial state in...
-        path = np.zeros((self.num_path, self.dim_state))
-        path[:] = cur_state
+        # the controls do not depend on the states, so sample them all first
+        actions = eps + self.act_sequence[:, None, :]
+        # bound actions if necessary
+        if self.umin is not None and self.umax is not None:
+            actions = np.minimum(self.umax/self.ctrl_scale, 
+                    np.maximum(self.umin/self.ctrl_scale, actions))
+            eps = actions - self.act_sequence[:, None, :]
+        ctrls = actions * self.ctrl_scale
+        # then predict every path with a single rollout, num_path by H+1 by state_dim
+        init_states = np.tile(cur_state, (self.num_path, 1))
+        path = self.model.rollout(init_states, ctrls.transpose((1, 0, 2)))
         costs = np.zeros(self.num_path)
-        action_cost = np.zeros_like(costs)
         for i in range(self.H):
-            actions = eps[i] + self.act_sequence[i]
-            # bound actions if necessary
-            if self.umin is not None and self.umax is not None:
-                actions = np.minimum(self.umax/self.ctrl_scale, 
-                        np.maximum(self.umin/self.ctrl_scale, actions))
-                eps[i] = actions - self.act_sequence[i]
-            # costs += self.cost_eqn(path[i], actions) + self.lmda / self.sigma * np.einsum('ij,ij->i', actions, eps[i])
-            # path[i + 1] = self.dyn_eqn(path[i], actions)
-            costs += self.cost_eqn(path, actions*self.ctrl_scale)
-            action_cost += self.lmda / self.sigma * np.einsum('ij,ij->i', actions, eps[i])
-            path = self.dyn_eqn(path, actions*self.ctrl_scale)
+            costs += self.cost_eqn(path[:, i, :], ctrls[i])
+        action_cost = self.lmda / self.sigma * np.einsum('hij,hij->i', actions, eps)
         # the final cost
         if self.terminal_cost:
-            # costs += self.terminal_cost(path[-1])
-            costs += self.terminal_cost(path)
+            costs += self.terminal_cost(path[:, -1, :])
         # print('state = ', path, 'cost path = ', costs, 'pert_cost = ', action_cost)
         costs += action_cost
         # import pdb; pdb.set_trace()
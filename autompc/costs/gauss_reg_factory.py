@@ -3,6 +3,7 @@
 # Internal library includes
 from .cost_factory import CostFactory
 from . import QuadCost
+from ..trajectory_set import as_trajectory_set
 
 # External library includes
 import numpy as np
@@ -35,9 +36,7 @@ class GaussRegFactory(CostFactory):
         return True
 
     def __call__(self, cfg, task, trajs):
-        X = np.concatenate([traj.obs[:,:] for traj in trajs])
-        mean = np.mean(X, axis=0)
-        cov = np.cov(X, rowvar=0)
+        mean, cov = as_trajectory_set(trajs).get_obs_stats()
         Q = cfg["reg_weight"] * la.inv(cov)
         F = np.zeros_like(Q)
         R = np.zeros((self.system.ctrl_dim, self.system.ctrl_dim))
@@ -6,6 +6,7 @@ import numpy as np
 
 from .evaluator import ModelEvaluator
 from .. import utils
+from ..trajectory_set import TrajectorySet
 
 class HoldoutModelEvaluator(ModelEvaluator):
     """
@@ -44,10 +45,13 @@ class HoldoutModelEvaluator(ModelEvaluator):
             self.holdout = [self.trajs[i] for i in sorted(holdout_indices)]
         else:
             self.holdout = holdout_set
-        self.training_set = []
+        training_set = []
         for traj in self.trajs:
             if traj not in self.holdout:
-                self.training_set.append(traj)
+                training_set.append(traj)
+        # Pack the training set once, so transition arrays and statistics
+        # are shared by every model trained during tuning.
+        self.training_set = TrajectorySet.from_trajs(training_set)
 
     def __call__(self, model_factory, configuration):
         if self.verbose:
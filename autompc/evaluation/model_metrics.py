@@ -1,13 +1,12 @@
 import numpy as np
 from .. import zeros
+from ..trajectory_set import as_trajectory_set
+from ..sysid.standardizer import Standardizer
 from pdb import set_trace
 
 
 def normalize(means, std, A):
-    At = []
-    for i in range(A.shape[1]):
-        At.append((A[:,i] - means[i]) / std[i])
-    return np.vstack(At).T
+    return Standardizer(means, std).transform(A)
 
 def get_model_rmse(model, trajs, horizon=1):
     """
@@ -31,8 +30,11 @@ def get_model_rmse(model, trajs, horizon=1):
             state = model.traj_to_states(traj[:-horizon])
         else:
             state = traj.obs[:-horizon, :]
-        for k in range(horizon):
-            state = model.pred_batch(state, traj.ctrls[k:-(horizon-k), :])
+        # ctrl_seqs[t] holds the controls applied from time t
+        n_starts = len(traj) - horizon
+        ctrl_seqs = traj.ctrls[np.arange(n_starts)[:, np.newaxis]
+                + np.arange(horizon)]
+        state = model.rollout(state, ctrl_seqs)[:, -1, :]
         if hasattr(model, "traj_to_states"):
             state = state[:,:model.system.obs_dim]
         actual = traj.obs[horizon:]
@@ -90,9 +92,8 @@ def get_model_rmsmens(model, trajs, horiz=1):
         Prediction horizon at which to evaluate.
         Default is 1.
     """
-    dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
-    dy_means = np.mean(dY, axis=0)
-    dy_std = np.std(dY, axis=0)
+    _, _, dy_means, dy_std = as_trajectory_set(trajs).get_transition_stats()
+    dy_scaler = Standardizer(dy_means, dy_std)
 
     sqerrss = []
     for traj in trajs:
@@ -102,8 +103,8 @@ def get_model_rmsmens(model, trajs, horiz=1):
             state = model.pred_parallel(state, traj.ctrls[k:-(horiz-k), :])
         pred_deltas = state - pstate
         act_deltas = traj.obs[horiz:] - traj.obs[horiz-1:-1]
-        norm_pred_deltas = normalize(dy_means, dy_std, pred_deltas)
-        norm_act_deltas = normalize(dy_means, dy_std, act_deltas)
+        norm_pred_deltas = dy_scaler.transform(pred_deltas, out=pred_deltas)
+        norm_act_deltas = dy_scaler.transform(act_deltas, out=act_deltas)
         sqerrs = (norm_pred_deltas - norm_act_deltas) ** 2
         sqerrss.append(sqerrs)
     sqerrs = np.concatenate(sqerrss)
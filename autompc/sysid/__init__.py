@@ -1,7 +1,30 @@
-from .arx import ARX, ARXFactory
-from .koopman import Koopman, KoopmanFactory
-from .sindy import SINDy, SINDyFactory
+import importlib
+
+# Models are imported on first access, so that using one model does not
+# require the dependencies of the others.  In particular NumpyMLP can be
+# loaded without torch.
+_model_modules = {
+    "ARX" : ".arx", "ARXFactory" : ".arx", "ARXJacobian" : ".arx",
+    "Koopman" : ".koopman", "KoopmanFactory" : ".koopman",
+    "SINDy" : ".sindy", "SINDyFactory" : ".sindy",
+    "MLP" : ".mlp", "MLPFactory" : ".mlp",
+    "EnsembleMLP" : ".ensemble_mlp", "EnsembleMLPFactory" : ".ensemble_mlp",
+    "NumpyMLP" : ".numpy_mlp",
+    "Standardizer" : ".standardizer",
+    "ApproximateGPModel" : ".largegp", "ApproximateGPModelFactory" : ".largegp",
+    "RFFGP" : ".rff_gp", "RFFGPFactory" : ".rff_gp",
+}
 #from .gp import GaussianProcess
-from .mlp import MLP, MLPFactory
-from .largegp import ApproximateGPModel, ApproximateGPModelFactory
 #from .linearize import LinearizedModel
+
+__all__ = list(_model_modules)
+
+def __getattr__(name):
+    if name not in _model_modules:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_model_modules[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
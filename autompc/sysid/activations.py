@@ -0,0 +1,45 @@
+"""
+Activation functions shared by the feed-forward network models.  This
+module only depends on numpy, so that NumpyMLP can be used without torch;
+the torch networks in mlp.py take their constants from here.
+"""
+import numpy as np
+
+NONLINEARITIES = ["relu", "tanh", "sigmoid", "selu"]
+
+# Constants of the SELU activation, as in torch.nn.SELU
+SELU_SCALE = 1.0507009873554805
+SELU_ALPHA = 1.6732632423543772
+
+def check_nonlintype(nonlintype):
+    if nonlintype not in NONLINEARITIES:
+        raise ValueError("Unsupported nonlinearity: {}".format(nonlintype))
+
+def apply_nonlin(nonlintype, y, out):
+    """Apply the activation to pre-activation y, writing into out."""
+    if nonlintype == 'relu':
+        np.maximum(y, 0.0, out=out)
+    elif nonlintype == 'tanh':
+        np.tanh(y, out=out)
+    elif nonlintype == 'sigmoid':
+        np.negative(y, out=out)
+        np.exp(out, out=out)
+        out += 1.0
+        np.reciprocal(out, out=out)
+    elif nonlintype == 'selu':
+        neg = SELU_ALPHA * np.expm1(np.minimum(y, 0.0))
+        np.maximum(y, 0.0, out=out)
+        out += neg
+        out *= SELU_SCALE
+    return out
+
+def nonlin_grad(nonlintype, y, x):
+    """Derivative of the activation at pre-activation y, output x."""
+    if nonlintype == 'relu':
+        return (y > 0).astype(y.dtype)
+    elif nonlintype == 'tanh':
+        return 1 - x**2
+    elif nonlintype == 'sigmoid':
+        return x * (1 - x)
+    elif nonlintype == 'selu':
+        return np.where(y > 0, SELU_SCALE, SELU_SCALE * SELU_ALPHA * np.exp(y))
@@ -9,6 +9,9 @@ from ConfigSpace import ConfigurationSpace
 from ConfigSpace.hyperparameters import UniformIntegerHyperparameter
 
 from .model import Model, ModelFactory
+from .least_squares import StreamingLeastSquares, RecursiveLeastSquares
+from ..trajectory import Trajectory
+from ..trajectory_set import as_trajectory_set
 #from ..hyper import IntRangeHyperparam
 
 class ARXFactory(ModelFactory):
@@ -26,6 +29,17 @@ class ARXFactory(ModelFactory):
 
     - *history* (Type: int, Low: 1, High: 10, Default: 4): Size of history window
       for ARX model.
+
+    Parameters
+
+    - *stream_chunk_size* (Type: int, Default: None): If set, fit by accumulating
+      normal equations over chunks of about this many samples instead of building
+      the whole regression matrix.  See `ARX.train_streaming`.
+    - *ridge* (Type: float, Default: 0.0): Ridge regularization weight for streaming
+      training.
+    - *forgetting* (Type: float, Default: 1.0): Forgetting factor in (0, 1] for
+      online adaptation with `ARX.partial_fit`.  Smaller values track changing
+      dynamics faster.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -39,10 +53,62 @@ class ARXFactory(ModelFactory):
         cs.add_hyperparameter(history)
         return cs
 
+class ARXJacobian:
+    """
+    Jacobian of the ARX state transition, stored in its structured form.
+    The state [x_t, x_{t-1}, u_{t-1}, ..., x_{t-k+1}, u_{t-k+1}, 1] is
+    propagated by a dense coefficient block, which predicts the new
+    observation, and a shift of the history.  Products with the Jacobian
+    cost O(n d) for observation size n and state size d instead of the
+    O(d^2) of the dense matrices.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.state_coeffs = model._state_coeffs
+        self.ctrl_coeffs = model._ctrl_coeffs
+
+    def dot(self, dstates, dctrls):
+        """
+        Returns A @ dstate + B @ dctrl for states of shape (..., state_dim)
+        and controls of shape (..., ctrl_dim).
+        """
+        return self.model._propagate(dstates, dctrls, self.state_coeffs,
+                self.ctrl_coeffs)
+
+    def rdot(self, adjoints):
+        """
+        Returns (A.T @ v, B.T @ v) for vectors v of shape (..., state_dim),
+        as used in backward passes.
+        """
+        n, l = self.model.system.obs_dim, self.model.system.ctrl_dim
+        m = n + l
+        d = adjoints.shape[-1]
+        state_adj = adjoints[..., :n] @ self.state_coeffs
+        ctrl_adj = adjoints[..., :n] @ self.ctrl_coeffs
+        if self.model.k > 1:
+            state_adj[..., :n] += adjoints[..., n:2*n]
+            state_adj[..., n:d-1-m] += adjoints[..., n+m:d-1]
+            ctrl_adj += adjoints[..., 2*n:2*n+l]
+        state_adj[..., -1] += adjoints[..., -1]
+        return state_adj, ctrl_adj
+
+    def todense(self):
+        """Returns the dense matrices (A, B)."""
+        return self.model.A, self.model.B
+
 class ARX(Model):
-    def __init__(self, system, history):
+    def __init__(self, system, history, stream_chunk_size=None, ridge=0.0,
+            forgetting=1.0):
         super().__init__(system)
+        if not 0.0 < forgetting <= 1.0:
+            raise ValueError("forgetting must be in (0, 1]")
         self.k = history
+        self.stream_chunk_size = stream_chunk_size
+        self.ridge = ridge
+        self.forgetting = forgetting
+        self._rls = None
+        self._gram = None
+        self._train_trajs = None
 
     def _get_feature_vector(self, traj, t=None):
         k = self.k
@@ -58,43 +124,56 @@ class ARX(Model):
         feature_elements += [np.ones(1), traj[t-1].ctrl]
         return np.concatenate(feature_elements)
 
-    def _get_all_feature_vectors(self, traj):
-        k = self.k
-        feature_vectors = np.zeros((len(traj), k*(self.system.obs_dim + self.system.ctrl_dim)+1))
-        feature_vectors[:,:self.system.obs_dim] = traj.obs
-        j = self.system.obs_dim
-        for i in range(1, k, 1):
-            feature_vectors[:,j:j+self.system.obs_dim] = np.concatenate([traj.obs[:1,:]]*i + [traj.obs[:-i, :]])
-            j += self.system.obs_dim
-            feature_vectors[:,j:j+self.system.ctrl_dim] = np.concatenate([traj.ctrls[:1,:]]*i + [traj.ctrls[:-i, :]])
-            j += self.system.ctrl_dim
-        feature_vectors[:,-(self.system.ctrl_dim+1)] = 1
-        feature_vectors[:,-self.system.ctrl_dim:] = traj.ctrls
+    def _get_feature_matrix(self, obs, ctrls, rows, starts):
+        """
+        Feature vectors for the time steps at the given rows of stacked
+        observation and control arrays.  starts gives the first row of the
+        trajectory containing each step, where the history is clamped.
+        """
+        n = self.system.obs_dim
+        l = self.system.ctrl_dim
+        feature_vectors = np.empty((len(rows), self._get_fvec_size()))
+        feature_vectors[:,:n] = obs[rows]
+        j = n
+        for i in range(1, self.k):
+            hist = np.maximum(rows - i, starts)
+            feature_vectors[:,j:j+n] = obs[hist]
+            j += n
+            feature_vectors[:,j:j+l] = ctrls[hist]
+            j += l
+        feature_vectors[:,-(l+1)] = 1
+        feature_vectors[:,-l:] = ctrls[rows]
 
         return feature_vectors
 
+    def _get_all_feature_vectors(self, traj):
+        rows = np.arange(len(traj))
+        return self._get_feature_matrix(traj.obs, traj.ctrls, rows, 0)
+
     def _get_fvec_size(self):
         k = self.k
         return 1 + k*self.system.obs_dim + k*self.system.ctrl_dim
         
     def _get_training_matrix_and_targets(self, trajs):
-        nsamples = sum([len(traj) for traj in trajs])
-        matrix = np.zeros((nsamples, self._get_fvec_size()))
-        targets = np.zeros((nsamples, self.system.obs_dim))
-
-        i = 0
-        for traj in trajs:
-            for t in range(1, len(traj)):
-                matrix[i, :] = self._get_feature_vector(traj, t)
-                targets[i, :] = traj[t].obs
-                i += 1
+        # Featurize every transition of every trajectory at once
+        trajs = as_trajectory_set(trajs)
+        rows = trajs.transition_indices
+        starts = np.repeat(trajs.offsets[:-1], trajs.lengths)[rows]
+        matrix = self._get_feature_matrix(trajs.obs, trajs.ctrls, rows, starts)
+        targets = trajs.obs[rows+1]
 
         return matrix, targets
 
     def update_state(self, state, new_ctrl, new_obs):
-        # Shift the targets
-        newstate = self.A @ state + self.B @ new_ctrl
-        newstate[:self.system.obs_dim] = new_obs
+        # Shift the history, then insert the new observation
+        n, l = self.system.obs_dim, self.system.ctrl_dim
+        newstate = np.empty_like(state, dtype=np.float64)
+        if self.k > 1:
+            newstate[n+n+l:-1] = state[n:-1-n-l]
+            newstate[n:2*n] = state[:n]
+            newstate[2*n:2*n+l] = new_ctrl
+        newstate[-1] = state[-1]
+        newstate[:n] = new_obs
 
         return newstate
 
@@ -108,13 +187,95 @@ class ARX(Model):
         return state[0:self.system.obs_dim]
 
     def train(self, trajs, silent=False):
+        if self.stream_chunk_size is not None:
+            self.train_streaming(trajs, self.stream_chunk_size)
+            return
         matrix, targets = self._get_training_matrix_and_targets(trajs)
 
-        coeffs = np.zeros((self.system.obs_dim, self._get_fvec_size()))
-        for i in range(targets.shape[1]):
-            res, _, _,  _ = la.lstsq(matrix, targets[:,i], rcond=None)
-            coeffs[i,:] = res
+        coeffs, _, _, _ = la.lstsq(matrix, targets, rcond=None)
+        self._set_coeffs(coeffs.T)
+        self._rls = None
+        # the Gram matrix is only needed by partial_fit, so it is computed
+        # from the training data on the first call
+        self._gram = None
+        self._train_trajs = trajs
+
+    def train_streaming(self, trajs, chunk_size=65536):
+        """
+        Fit the ARX coefficients without building the whole regression
+        matrix.  Trajectories are featurized in groups of about chunk_size
+        samples, the normal equations are accumulated, and a single
+        Cholesky solve gives all output columns.
+
+        Parameters
+        ----------
+            trajs : TrajectorySet, iterable of Trajectory, or Function () -> iterable of Trajectory
+                Training data, read once.
+            chunk_size : int
+                Approximate number of samples featurized at once.
+        """
+        if callable(trajs):
+            trajs = trajs()
+        lstsq = StreamingLeastSquares(self._get_fvec_size(), self.system.obs_dim)
+        buf = []
+        buf_size = 0
+        for traj in trajs:
+            buf.append(traj)
+            buf_size += len(traj) - 1
+            if buf_size >= chunk_size:
+                lstsq.add(*self._get_training_matrix_and_targets(buf))
+                buf = []
+                buf_size = 0
+        if buf_size > 0:
+            lstsq.add(*self._get_training_matrix_and_targets(buf))
+        coeffs = lstsq.solve(self.ridge)
+        self._set_coeffs(coeffs.T)
+        self._rls = None
+        self._gram = lstsq.gram + self.ridge * np.eye(lstsq.gram.shape[0])
+        self._train_trajs = None
+
+    def partial_fit(self, trajs):
+        """
+        Adapt the trained coefficients to new data with recursive least
+        squares, at O(d^2) cost per transition for d features.  Older data
+        is discounted by the forgetting factor.  The system matrices are
+        replaced rather than modified in place, so controllers which query
+        the model on every step, such as iLQR, use the adapted model from
+        their next step on.  Controllers which precompute gains from
+        `to_linear`, such as LQR, must be reset.
+
+        After training, the first call seeds recursive least squares with
+        the inverse of the training Gram matrix, which is computed from the
+        training data at that point.  If the model was not trained,
+        adaptation starts from its current coefficients, or zero, with a
+        weak prior.
+
+        Parameters
+        ----------
+            trajs : Trajectory or iterable of Trajectory
+                New data.  History before the start of each trajectory is
+                padded as in training.
+        """
+        if isinstance(trajs, Trajectory):
+            trajs = [trajs]
+        if self._rls is None:
+            coeffs = (self.coeffs.T if hasattr(self, "coeffs")
+                    else np.zeros((self._get_fvec_size(), self.system.obs_dim)))
+            if self._train_trajs is not None:
+                matrix, _ = self._get_training_matrix_and_targets(self._train_trajs)
+                self._gram = matrix.T @ matrix
+            if self._gram is not None:
+                self._rls = RecursiveLeastSquares.from_gram(self._gram, coeffs,
+                        forgetting=self.forgetting)
+                self._gram = None
+                self._train_trajs = None
+            else:
+                self._rls = RecursiveLeastSquares(coeffs, forgetting=self.forgetting)
+        self._rls.update(*self._get_training_matrix_and_targets(trajs))
+        self._set_coeffs(self._rls.coeffs.T.copy())
 
+    def _set_coeffs(self, coeffs):
+        self.coeffs = coeffs
         # First we construct the system matrices
         A = np.zeros((self.state_dim, self.state_dim))
         B = np.zeros((self.state_dim, self.system.ctrl_dim))
@@ -141,23 +302,68 @@ class ARX(Model):
         B[2*n : 2*n + l, :] = np.eye(l)
 
         self.A, self.B = A, B
+        # Coefficient blocks for structured propagation
+        self._state_coeffs = np.ascontiguousarray(coeffs[:, :-l])
+        self._ctrl_coeffs = np.ascontiguousarray(coeffs[:, -l:])
+
+    def _propagate(self, states, ctrls, state_coeffs, ctrl_coeffs, out=None):
+        """
+        Apply the ARX transition to states of shape (..., state_dim) as one
+        product with the coefficient blocks plus a shift of the history,
+        without forming the dense (d, d) state matrix.
+        """
+        n, l = self.system.obs_dim, self.system.ctrl_dim
+        m = n + l
+        if out is None:
+            out = np.empty(states.shape)
+        d = out.shape[-1]
+        out[..., :n] = states @ state_coeffs.T + ctrls @ ctrl_coeffs.T
+        if self.k > 1:
+            out[..., n+m:d-1] = states[..., n:d-1-m]
+            out[..., n:2*n] = states[..., :n]
+            out[..., 2*n:2*n+l] = ctrls
+        out[..., -1] = states[..., -1]
+        return out
 
 
     def pred(self, state, ctrl):
-        statenew = self.A @ state + self.B @ ctrl
-
-        return statenew
+        return self._propagate(state, ctrl, self._state_coeffs,
+                self._ctrl_coeffs)
 
     def pred_batch(self, states, ctrls):
-        statesnew = self.A @ states.T + self.B @ ctrls.T
-
-        return statesnew.T
+        return self._propagate(states, ctrls, self._state_coeffs,
+                self._ctrl_coeffs)
 
     def pred_diff(self, state, ctrl):
-        statenew = self.A @ state + self.B @ ctrl
+        statenew = self.pred(state, ctrl)
 
         return statenew, self.A, self.B
 
+    def pred_diff_structured(self, state, ctrl):
+        """
+        Like pred_diff, but returns the Jacobian as an ARXJacobian, whose
+        products exploit the shift structure of the state matrix.
+
+        Returns
+        -------
+            statenew : numpy array of size self.state_dim
+            jac : ARXJacobian
+        """
+        return self.pred(state, ctrl), ARXJacobian(self)
+
+    def rollout(self, init_states, ctrl_seqs):
+        """
+        Open-loop rollouts with the structured transition, at O(n d) per
+        step instead of O(d^2).
+        """
+        N, H = ctrl_seqs.shape[:2]
+        states = np.empty((N, H+1, self.state_dim))
+        states[:,0,:] = init_states
+        for k in range(H):
+            self._propagate(states[:,k,:], ctrl_seqs[:,k,:], self._state_coeffs,
+                    self._ctrl_coeffs, out=states[:,k+1,:])
+        return states
+
     def to_linear(self):
         return self.A, self.B
 
@@ -170,6 +376,9 @@ class ARX(Model):
         return {"coeffs" : np.copy(self.coeffs)}
 
     def set_parameters(self, params):
-        self.coeffs = np.copy(params["coeffs"])
+        self._set_coeffs(np.copy(params["coeffs"]))
+        self._rls = None
+        self._gram = None
+        self._train_trajs = None
 
 
@@ -1,7 +1,7 @@
 import numpy as np
 from pdb import set_trace
 
-from .model import Model
+from .model import Model, linear_rollout
 import ConfigSpace as CS
 import ConfigSpace.hyperparameters as CSH
 import ConfigSpace.conditions as CSC
@@ -39,6 +39,9 @@ class DummyLinear(Model):
 
         return xpred, np.copy(self.A), np.copy(self.B)
 
+    def rollout(self, init_states, ctrl_seqs):
+        return linear_rollout(self, init_states, ctrl_seqs)
+
     def to_linear(self):
         return np.copy(self.A), np.copy(self.B)
 
@@ -0,0 +1,274 @@
+"""
+Ensemble of independently initialized MLPs, stored as batched weight
+tensors so that all members train and predict together.
+"""
+import copy
+import math
+import numpy as np
+from tqdm import tqdm
+import sys
+import torch
+
+from .model import Model, ModelFactory
+from .mlp import MLPFactory, make_nonlin, nonlin_grad
+from .standardizer import TransitionNormalization
+from ..trajectory_set import as_trajectory_set
+
+class EnsembleNet(torch.nn.Module):
+    def __init__(self, n_members, n_in, n_out, hidden_sizes, nonlintype):
+        """
+        E feedforward networks of the same architecture.  Layer weights are
+        stored as tensors of shape (E, n_out, n_in), and every member is
+        evaluated at once with batched matrix products.
+        """
+        assert len(hidden_sizes) > 0
+        torch.nn.Module.__init__(self)
+        self.weights = torch.nn.ParameterList()
+        self.biases = torch.nn.ParameterList()
+        last_n = n_in
+        for size in list(hidden_sizes) + [n_out]:
+            # same initialization as torch.nn.Linear, drawn per member
+            bound = 1.0 / math.sqrt(last_n)
+            self.weights.append(torch.nn.Parameter(
+                torch.empty(n_members, size, last_n).uniform_(-bound, bound)))
+            self.biases.append(torch.nn.Parameter(
+                torch.empty(n_members, size).uniform_(-bound, bound)))
+            last_n = size
+        self.nonlintype = nonlintype
+        self.nonlin = make_nonlin(nonlintype)
+
+    @property
+    def n_members(self):
+        return self.weights[0].shape[0]
+
+    def forward(self, x):
+        """
+        Evaluate all members.  x has shape (E, N, n_in), or (N, n_in) to
+        feed the same inputs to every member; the output has shape
+        (E, N, n_out).
+        """
+        if x.dim() == 2:
+            x = x.expand(self.n_members, -1, -1)
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            x = self.nonlin(torch.baddbmm(b.unsqueeze(1), x, w.transpose(1, 2)))
+        return torch.baddbmm(self.biases[-1].unsqueeze(1), x,
+                self.weights[-1].transpose(1, 2))
+
+    def forward_jacobian(self, x):
+        """
+        Evaluate all members and their input Jacobians on inputs of shape
+        (N, n_in).  Returns outputs of shape (E, N, n_out) and Jacobians
+        of shape (E, N, n_out, n_in).
+        """
+        x = x.expand(self.n_members, -1, -1)
+        jac = None
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            y = torch.baddbmm(b.unsqueeze(1), x, w.transpose(1, 2))
+            x = self.nonlin(y)
+            if jac is None:
+                jac = w.unsqueeze(1).expand(-1, x.shape[1], -1, -1)
+            else:
+                jac = torch.matmul(w.unsqueeze(1), jac)
+            jac = nonlin_grad(self.nonlintype, y, x).unsqueeze(-1) * jac
+        out = torch.baddbmm(self.biases[-1].unsqueeze(1), x,
+                self.weights[-1].transpose(1, 2))
+        return out, torch.matmul(self.weights[-1].unsqueeze(1), jac)
+
+
+class EnsembleMLPFactory(ModelFactory):
+    """
+    An ensemble of multi-layer perceptrons with the same architecture but
+    independent random initializations and minibatch orders.  All members
+    are trained in one loop and evaluated in one batched forward pass.
+    Predictions are the ensemble mean; the member spread is available
+    from `EnsembleMLP.pred_mean_std`.
+
+    Parameters
+
+    - *n_members* (Type: int, Default: 5): Number of ensemble members.
+    - *n_batch* (Type: int, Default: 64): Training batch size of each member.
+    - *n_train_iters* (Type: int, Default: 50): Number of training epochs
+    - *seed* (Type: int, Default: 100): Random seed for the initial weights.
+    - *use_cuda* (Type: bool, Default: True): Train and predict on the GPU when
+      available.
+
+    The MLP options *stream_chunk_size*, *precision* and *jit* are not
+    supported; the ensemble always trains in memory and predicts in float64.
+
+    Hyperparameters are the same as for the MLP.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.Model = EnsembleMLP
+        self.name = "EnsembleMLP"
+
+    def get_configuration_space(self):
+        return MLPFactory.get_configuration_space(self)
+
+class EnsembleMLP(TransitionNormalization, Model):
+    def __init__(self, system, n_hidden_layers=3, hidden_size=128,
+            nonlintype='relu', n_train_iters=50, n_batch=64, lr=1e-3,
+            hidden_size_1=None, hidden_size_2=None, hidden_size_3=None,
+            hidden_size_4=None, seed=100, use_cuda=True, n_members=5):
+        Model.__init__(self, system)
+        nx, nu = system.obs_dim, system.ctrl_dim
+        n_hidden_layers = int(n_hidden_layers)
+        hidden_sizes = [hidden_size] * n_hidden_layers
+        for i, size in enumerate([hidden_size_1, hidden_size_2, hidden_size_3,
+                hidden_size_4]):
+            if size is not None:
+                hidden_sizes[i] = size
+        torch.manual_seed(seed)
+        self.net = EnsembleNet(n_members, nx + nu, nx, hidden_sizes, nonlintype)
+        self._train_data = (n_train_iters, n_batch, lr)
+        self._device = (torch.device('cuda') if (use_cuda and torch.cuda.is_available())
+                else torch.device('cpu'))
+        self.net = self.net.double().to(self._device)
+        self._infer_net = None
+
+    @property
+    def n_members(self):
+        return self.net.n_members
+
+    def traj_to_state(self, traj):
+        return traj[-1].obs.copy()
+
+    def update_state(self, state, new_ctrl, new_obs):
+        return new_obs.copy()
+
+    @property
+    def state_dim(self):
+        return self.system.obs_dim
+
+    def train(self, trajs, silent=False, seed=100):
+        torch.manual_seed(seed)
+        n_iter, n_batch, lr = self._train_data
+        trajs = as_trajectory_set(trajs)
+        X, U, Xnext = trajs.transitions
+        dY = Xnext - X
+        XU = np.concatenate((X, U), axis = 1) # stack X and U together
+        self._set_stats(*trajs.get_transition_stats())
+        self._xu_scaler.transform(XU, out=XU)
+        self._dy_scaler.transform(dY, out=dY)
+        x_all = torch.from_numpy(XU).to(self._device)
+        y_all = torch.from_numpy(dY).to(self._device)
+        self.net.train()
+        for param in self.net.parameters():
+            param.requires_grad_(True)
+        optim = torch.optim.Adam(self.net.parameters(), lr=lr)
+        lossfun = torch.nn.SmoothL1Loss()
+        if silent:
+            itr = range(n_iter)
+        else:
+            print("Training EnsembleMLP: ", end="")
+            itr = tqdm(range(n_iter), file=sys.stdout)
+        n_samples = x_all.shape[0]
+        for _ in itr:
+            # each member visits the data in its own order
+            perm = torch.argsort(torch.rand(self.n_members, n_samples,
+                device=self._device), dim=1)
+            for start in range(0, n_samples, n_batch):
+                idx = perm[:, start:start+n_batch]
+                optim.zero_grad()
+                # the mean over members keeps their gradients independent
+                loss = lossfun(self.net(x_all[idx]), y_all[idx])
+                loss.backward()
+                optim.step()
+        self.net.eval()
+        for param in self.net.parameters():
+            param.requires_grad_(False)
+        self._build_inference_net()
+
+    def _build_inference_net(self):
+        """
+        Copy the trained ensemble for prediction, folding normalization into
+        the first and last layers of every member.
+        """
+        net = copy.deepcopy(self.net)
+        with torch.no_grad():
+            for i, fold in [(0, self._xu_scaler.fold_input),
+                    (-1, self._dy_scaler.fold_output)]:
+                weight, bias = fold(net.weights[i].cpu().numpy(),
+                        net.biases[i].cpu().numpy())
+                net.weights[i].copy_(torch.from_numpy(weight))
+                net.biases[i].copy_(torch.from_numpy(bias))
+        self._infer_net = net
+
+    def pred_members(self, state, ctrl):
+        """
+        Predict the next state with every ensemble member.
+
+        Parameters
+        ----------
+            state : numpy array of shape (N, state_dim)
+            ctrl : numpy array of shape (N, ctrl_dim)
+
+        Returns
+        -------
+            preds : numpy array of shape (n_members, N, state_dim)
+        """
+        X = np.concatenate([state, ctrl], axis=1)
+        with torch.no_grad():
+            dy = self._infer_net(torch.from_numpy(X).to(self._device,
+                torch.float64))
+        return state + dy.cpu().numpy()
+
+    def pred_mean_std(self, state, ctrl):
+        """
+        Returns the ensemble mean prediction and the standard deviation
+        across members, each of shape (N, state_dim).
+        """
+        preds = self.pred_members(state, ctrl)
+        return np.mean(preds, axis=0), np.std(preds, axis=0)
+
+    def pred(self, state, ctrl):
+        return self.pred_batch(state[np.newaxis,:], ctrl[np.newaxis,:])[0]
+
+    def pred_batch(self, state, ctrl):
+        return np.mean(self.pred_members(state, ctrl), axis=0)
+
+    def rollout(self, init_states, ctrl_seqs):
+        """
+        Open-loop rollouts of the ensemble mean, computed on the device.
+        """
+        N, H = ctrl_seqs.shape[:2]
+        with torch.no_grad():
+            ctrls = torch.from_numpy(ctrl_seqs).to(self._device, torch.float64)
+            states = torch.empty((N, H+1, self.state_dim), dtype=torch.float64,
+                    device=self._device)
+            states[:,0,:] = torch.from_numpy(init_states)
+            for k in range(H):
+                x = torch.cat([states[:,k,:], ctrls[:,k,:]], dim=-1)
+                states[:,k+1,:] = states[:,k,:] + self._infer_net(x).mean(dim=0)
+        return states.cpu().numpy()
+
+    def pred_diff(self, state, ctrl):
+        out, state_jacs, ctrl_jacs = self.pred_diff_batch(state[np.newaxis,:],
+                ctrl[np.newaxis,:])
+        return out[0], state_jacs[0], ctrl_jacs[0]
+
+    def pred_diff_batch(self, state, ctrl):
+        """Ensemble mean prediction, with the Jacobian of the mean"""
+        X = np.concatenate([state, ctrl], axis=1)
+        with torch.no_grad():
+            xin = torch.from_numpy(X).to(self._device, torch.float64)
+            dy, jac = self._infer_net.forward_jacobian(xin)
+            dy = dy.mean(dim=0).cpu().numpy()
+            jac = jac.mean(dim=0).cpu().numpy()
+        n = self.system.obs_dim
+        state_jacs = jac[:, :, :n] + np.eye(n)
+        ctrl_jacs = jac[:, :, n:]
+        return state + dy, state_jacs, ctrl_jacs
+
+    def get_parameters(self):
+        return {"net_state" : self.net.state_dict(),
+                "xu_means" : self.xu_means,
+                "xu_std" : self.xu_std,
+                "dy_means" : self.dy_means,
+                "dy_std" : self.dy_std }
+
+    def set_parameters(self, params):
+        self._set_stats(params["xu_means"], params["xu_std"],
+                params["dy_means"], params["dy_std"])
+        self.net.load_state_dict(params["net_state"])
+        self._build_inference_net()
@@ -0,0 +1,151 @@
+"""
+Initialization strategies for the inducing points of sparse GPs.  All
+strategies work on normalized inputs, where an RBF kernel with unit
+lengthscale is a reasonable measure of similarity.
+"""
+import numpy as np
+
+def _sq_dists(X, C):
+    """Squared distances between the rows of X and C."""
+    d = (X**2).sum(axis=1)[:, np.newaxis] - 2 * X @ C.T + (C**2).sum(axis=1)
+    return np.maximum(d, 0.0, out=d)
+
+def kmeans_points(X, count, rng, n_iters=100, batch_size=1024):
+    """
+    Mini-batch k-means centers of X.  Each iteration assigns a random batch
+    to its nearest centers and moves every center towards the mean of its
+    assigned samples with a per-center learning rate of 1 / count.
+    """
+    centers = X[rng.choice(X.shape[0], count, replace=False)].copy()
+    counts = np.zeros(count)
+    for _ in range(n_iters):
+        batch = X[rng.integers(X.shape[0], size=batch_size)]
+        assign = np.argmin(_sq_dists(batch, centers), axis=1)
+        n_assigned = np.bincount(assign, minlength=count)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assign, batch)
+        counts += n_assigned
+        hit = n_assigned > 0
+        centers[hit] += ((sums[hit] - n_assigned[hit, np.newaxis] * centers[hit])
+                / counts[hit, np.newaxis])
+    return centers
+
+def greedy_variance_points(X, count, rng, max_candidates=20000):
+    """
+    Greedily pick the sample with the largest posterior variance under a
+    unit RBF kernel given the points already picked, i.e. a pivoted
+    Cholesky factorization of the kernel matrix.  This is the greedy
+    approximation of the maximum-volume (DPP MAP) subset.  Candidates are
+    subsampled to max_candidates rows.  Selection stops early once every
+    remaining candidate duplicates a picked point, so fewer than count
+    points are returned when X has fewer distinct rows.
+    """
+    if X.shape[0] > max_candidates:
+        X = X[rng.choice(X.shape[0], max_candidates, replace=False)]
+    variance = np.ones(X.shape[0])
+    factor = np.zeros((count, X.shape[0]))
+    selected = np.empty(count, dtype=int)
+    for j in range(count):
+        i = np.argmax(variance)
+        if variance[i] <= 1e-10:
+            return X[selected[:j]]
+        selected[j] = i
+        k = np.exp(-0.5 * _sq_dists(X, X[i:i+1])[:, 0])
+        factor[j] = (k - factor[:j].T @ factor[:j, i]) / np.sqrt(variance[i])
+        variance -= factor[j]**2
+        variance[i] = -np.inf
+    return X[selected]
+
+def _allocate(lengths, count):
+    """
+    Split count points over trajectories of the given lengths, giving each
+    at least one point and the rest in proportion to length - 1, without
+    exceeding any length.  Requires len(lengths) <= count <= sum(lengths).
+    """
+    alloc = np.ones(len(lengths), dtype=int)
+    spare = lengths - 1
+    if spare.sum() == 0:
+        return alloc
+    share = (count - len(lengths)) * spare / spare.sum()
+    alloc += np.floor(share).astype(int)
+    # hand out the remainder by largest fractional share
+    order = np.argsort(np.floor(share) - share, kind="stable")
+    while alloc.sum() < count:
+        for i in order:
+            if alloc.sum() == count:
+                break
+            if alloc[i] < lengths[i]:
+                alloc[i] += 1
+    return alloc
+
+def stratified_points(X, count, offsets=None):
+    """
+    Rows of X stratified by trajectory.  Every trajectory gets at least one
+    point, and the remaining points are allocated in proportion to
+    trajectory length.  Within a trajectory, the points are the centers of
+    equally long time intervals.  If count is less than the number of
+    trajectories, the center rows of count evenly spaced trajectories are
+    taken instead.
+
+    Parameters
+    ----------
+        X : numpy array of shape (N, D)
+            Samples stored trajectory by trajectory
+        count : int
+            Number of points, at most N
+        offsets : numpy array of ints
+            Trajectory i occupies rows offsets[i] to offsets[i+1] of X.
+            Defaults to a single trajectory.
+    """
+    if offsets is None:
+        offsets = [0, X.shape[0]]
+    offsets = np.asarray(offsets)
+    lengths = np.diff(offsets)
+    starts = offsets[:-1][lengths > 0]
+    lengths = lengths[lengths > 0]
+    if count < len(lengths):
+        pick = ((np.arange(count) + 0.5) * len(lengths) / count).astype(int)
+        return X[starts[pick] + lengths[pick] // 2]
+    rows = [start + ((np.arange(k) + 0.5) * length / k).astype(int)
+            for start, length, k in zip(starts, lengths, _allocate(lengths, count))]
+    return X[np.concatenate(rows)]
+
+def select_inducing_points(X, count, method="kmeans", rng=None, offsets=None):
+    """
+    Choose initial inducing points for a sparse GP.
+
+    Parameters
+    ----------
+        X : numpy array of shape (N, D)
+            Normalized training inputs
+        count : int
+            Number of inducing points
+        method : str
+            One of "kmeans", "greedy_variance", "stratified", or "first",
+            which takes the first count rows.
+        rng : numpy.random.Generator
+            Random generator for the randomized methods
+        offsets : numpy array of ints
+            Trajectory boundaries in X for the "stratified" method, where
+            trajectory i occupies rows offsets[i] to offsets[i+1].
+
+    Returns
+    -------
+        points : numpy array of shape (M, D)
+            M is min(count, N), or less for "greedy_variance" if X has
+            fewer distinct rows.
+    """
+    if method not in ["kmeans", "greedy_variance", "stratified", "first"]:
+        raise ValueError("Unknown inducing point initialization: {}".format(method))
+    if rng is None:
+        rng = np.random.default_rng()
+    if count >= X.shape[0]:
+        return X.copy()
+    if method == "kmeans":
+        return kmeans_points(X, count, rng)
+    elif method == "greedy_variance":
+        return greedy_variance_points(X, count, rng)
+    elif method == "stratified":
+        return stratified_points(X, count, offsets)
+    else:
+        return X[:count].copy()
@@ -4,8 +4,11 @@ import scipy.linalg as sla
 from pdb import set_trace
 from sklearn.linear_model import  Lasso
 
-from .model import Model, ModelFactory
+from .model import Model, ModelFactory, linear_rollout
 from .stable_koopman import stabilize_discrete
+from .least_squares import StreamingLeastSquares, RecursiveLeastSquares
+from ..trajectory import Trajectory
+from ..trajectory_set import as_trajectory_set, iter_transition_chunks
 
 import ConfigSpace as CS
 import ConfigSpace.hyperparameters as CSH
@@ -37,6 +40,17 @@ class KoopmanFactory(ModelFactory):
     - *trig_basis* (Type: bool): Whether to use trig basis functions.
     - *trig_freq* (Type: int, Low: 1, High: 8, Default: 1): Maximum frequency of trig functions.
     - *product_terms* (Type: bool): Whether to include cross-product terms.
+
+    Parameters
+
+    - *stream_chunk_size* (Type: int, Default: None): If set, fit the lstsq model by
+      accumulating normal equations over chunks of this many transitions instead of
+      lifting the whole data set at once.  See `Koopman.train_streaming`.
+    - *ridge* (Type: float, Default: 0.0): Ridge regularization weight for streaming
+      training.
+    - *forgetting* (Type: float, Default: 1.0): Forgetting factor in (0, 1] for
+      online adaptation with `Koopman.partial_fit`.  Smaller values track changing
+      dynamics faster.
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -79,8 +93,18 @@ class KoopmanFactory(ModelFactory):
 class Koopman(Model):
     def __init__(self, system, method, lasso_alpha=None, poly_basis=False,
             poly_degree=1, trig_basis=False, trig_freq=1, product_terms=False,
-            use_cuda=None):
+            use_cuda=None, stream_chunk_size=None, ridge=0.0, forgetting=1.0):
         super().__init__(system)
+        if stream_chunk_size is not None and method != "lstsq":
+            raise ValueError("Streaming training requires method=\"lstsq\"")
+        if not 0.0 < forgetting <= 1.0:
+            raise ValueError("forgetting must be in (0, 1]")
+        self.stream_chunk_size = stream_chunk_size
+        self.ridge = ridge
+        self.forgetting = forgetting
+        self._rls = None
+        self._gram = None
+        self._train_trajs = None
 
         self.method = method
         if not lasso_alpha is None:
@@ -96,34 +120,48 @@ class Koopman(Model):
         self.trig_basis = trig_basis
         self.trig_freq = trig_freq
         if type(product_terms) == str:
-            self.product_terms = True if product_terms == "true" else False
+            product_terms = True if product_terms == "true" else False
+        self.product_terms = product_terms
 
-        self.basis_funcs = [lambda x: x]
+    @property
+    def _num_basis_funcs(self):
+        num = 1
         if self.poly_basis:
-            self.basis_funcs += [lambda x: x**i for i in range(2, 1+self.poly_degree)]
+            num += self.poly_degree - 1
         if self.trig_basis:
-            for i in range(1, 1+self.poly_degree):
-                self.basis_funcs += [lambda x: np.sin(i*x), lambda x : np.cos(i*x)]
+            num += 2 * self.trig_freq
+        return num
 
-    def _apply_basis(self, state):
-        tr_state = [b(x) for b in self.basis_funcs for x in state]
+    def _transform_observations(self, observations):
+        """
+        Lift an (N, obs_dim) array of observations into the Koopman basis.
+        Each basis function is applied to all observations at once, giving
+        blocks [x, x^2, ..., x^d, sin(x), cos(x), ..., sin(fx), cos(fx)],
+        optionally followed by the pairwise products of those features.
+        """
+        features = [observations]
+        if self.poly_basis:
+            features += [observations**i for i in range(2, 1+self.poly_degree)]
+        if self.trig_basis:
+            for i in range(1, 1+self.trig_freq):
+                features += [np.sin(i*observations), np.cos(i*observations)]
+        lifted = np.concatenate(features, axis=1)
         if self.product_terms:
-            pr_terms = []
-            for i, x in enumerate(tr_state):
-                for j, y in enumerate(tr_state):
-                    if i < j:
-                        pr_terms.append(x*y)
-            tr_state += pr_terms
+            rows, cols = np.triu_indices(lifted.shape[1], 1)
+            lifted = np.concatenate([lifted, lifted[:, rows] * lifted[:, cols]],
+                    axis=1)
+        return lifted
 
-        return np.array(tr_state)
-
-    def _transform_observations(self, observations):
-        return np.apply_along_axis(self._apply_basis, 1, observations)
+    def _apply_basis(self, state):
+        return self._transform_observations(state[np.newaxis,:])[0]
 
     def traj_to_state(self, traj):
         return self._transform_observations(traj.obs[:])[-1,:]
 
     def traj_to_states(self, traj):
+        """
+        Model states for every time step of traj, lifted in one batch.
+        """
         return self._transform_observations(traj.obs[:])
     
     def update_state(self, state, new_ctrl, new_obs):
@@ -131,13 +169,21 @@ class Koopman(Model):
 
     @property
     def state_dim(self):
-        return len(self.basis_funcs) * self.system.obs_dim
+        num_features = self._num_basis_funcs * self.system.obs_dim
+        if self.product_terms:
+            num_features += num_features * (num_features - 1) // 2
+        return num_features
 
     def train(self, trajs, silent=False):
-        trans_obs = [self._transform_observations(traj.obs[:]) for traj in trajs]
-        X = np.concatenate([obs[:-1,:] for obs in trans_obs]).T
-        Y = np.concatenate([obs[1:,:] for obs in trans_obs]).T
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs]).T
+        if self.stream_chunk_size is not None:
+            self.train_streaming(trajs, self.stream_chunk_size)
+            return
+        trajs = as_trajectory_set(trajs)
+        trans_obs = self._transform_observations(trajs.obs)
+        idxs = trajs.transition_indices
+        X = trans_obs[idxs].T
+        Y = trans_obs[idxs+1].T
+        U = trajs.ctrls[idxs].T
         
         n = X.shape[0] # state dimension
         m = U.shape[0] # control dimension    
@@ -162,6 +208,85 @@ class Koopman(Model):
             B = np.real(B)
 
         self.A, self.B = A, B
+        self._rls = None
+        # partial_fit builds the least-squares Gram matrix from the training
+        # data on its first call
+        self._gram = None
+        self._train_trajs = trajs
+
+    def train_streaming(self, trajs, chunk_size=65536):
+        """
+        Fit the least-squares Koopman operator without lifting the whole
+        data set at once.  The normal equations are accumulated chunk by
+        chunk and solved with a single Cholesky factorization, so memory
+        use is O((n+m)^2) in the lifted state dimension n.
+
+        Parameters
+        ----------
+            trajs : TrajectorySet, iterable of Trajectory, or Function () -> iterable of Trajectory
+                Training data, read once.
+            chunk_size : int
+                Approximate number of transitions lifted at once.
+        """
+        n = self.state_dim
+        lstsq = StreamingLeastSquares(n + self.system.ctrl_dim, n)
+        for X, U, Xnext in iter_transition_chunks(trajs, chunk_size):
+            XU = np.concatenate([self._transform_observations(X), U], axis=1)
+            lstsq.add(XU, self._transform_observations(Xnext))
+        coeffs = lstsq.solve(self.ridge)
+        self.A, self.B = coeffs.T[:, :n], coeffs.T[:, n:]
+        self._rls = None
+        self._gram = lstsq.gram + self.ridge * np.eye(lstsq.gram.shape[0])
+        self._train_trajs = None
+
+    def partial_fit(self, trajs):
+        """
+        Adapt the Koopman operator to new data with recursive least squares
+        on the lifted transitions, at O((n+m)^2) cost per transition.  Older
+        data is discounted by the forgetting factor.  A and B are replaced
+        rather than modified in place, so controllers which query the model
+        on every step, such as iLQR, use the adapted model from their next
+        step on.  Controllers which precompute gains from `to_linear`, such
+        as LQR, must be reset.
+
+        After training, the first call seeds recursive least squares with
+        the inverse of the training Gram matrix, which is computed from the
+        training data at that point.  If the model was not trained,
+        adaptation starts from its current A and B, or zero, with a weak
+        prior.  Only the "lstsq" method can be adapted, since recursive
+        least squares does not continue a lasso or stable fit.
+
+        Parameters
+        ----------
+            trajs : Trajectory or iterable of Trajectory
+                New data
+        """
+        if self.method != "lstsq":
+            raise ValueError("partial_fit requires method=\"lstsq\"")
+        if isinstance(trajs, Trajectory):
+            trajs = [trajs]
+        n = self.state_dim
+        if self._rls is None:
+            if hasattr(self, "A"):
+                coeffs = np.concatenate([self.A, self.B], axis=1).T
+            else:
+                coeffs = np.zeros((n + self.system.ctrl_dim, n))
+            if self._train_trajs is not None:
+                X, U, _ = self._train_trajs.transitions
+                XU = np.concatenate([self._transform_observations(X), U], axis=1)
+                self._gram = XU.T @ XU
+            if self._gram is not None:
+                self._rls = RecursiveLeastSquares.from_gram(self._gram, coeffs,
+                        forgetting=self.forgetting)
+                self._gram = None
+                self._train_trajs = None
+            else:
+                self._rls = RecursiveLeastSquares(coeffs, forgetting=self.forgetting)
+        X, U, Xnext = as_trajectory_set(trajs).transitions
+        XU = np.concatenate([self._transform_observations(X), U], axis=1)
+        self._rls.update(XU, self._transform_observations(Xnext))
+        AB = self._rls.coeffs.T
+        self.A, self.B = AB[:, :n].copy(), AB[:, n:].copy()
 
     def pred(self, state, ctrl):
         xpred = self.A @ state + self.B @ ctrl
@@ -177,6 +302,9 @@ class Koopman(Model):
 
         return xpred, np.copy(self.A), np.copy(self.B)
 
+    def rollout(self, init_states, ctrl_seqs):
+        return linear_rollout(self, init_states, ctrl_seqs)
+
     def to_linear(self):
         return np.copy(self.A), np.copy(self.B)
 
@@ -187,3 +315,6 @@ class Koopman(Model):
     def set_parameters(self, params):
         self.A = np.copy(params["A"])
         self.B = np.copy(params["B"])
+        self._rls = None
+        self._gram = None
+        self._train_trajs = None
@@ -3,6 +3,7 @@ Implement GP using GPytorch which naturally supports gradient computation.
 It's fairly scalable since it uses GPU and some other tricks.
 The gradient computation is a pain but eventually I was able to do it after some search.
 """
+import contextlib
 import copy
 import tqdm
 from pdb import set_trace
@@ -25,26 +26,23 @@ except:
 
 
 from .model import Model, ModelFactory
+from .standardizer import TransitionNormalization
+from .inducing_points import select_inducing_points
+from ..trajectory_set import as_trajectory_set
 
 
-def transform_input(xu_means, xu_std, XU):
-    XUt = []
-    for i in range(XU.shape[1]):
-        XUt.append((XU[:,i] - xu_means[i]) / xu_std[i])
-    return np.vstack(XUt).T
+class GPytorchGP(TransitionNormalization, Model):
+    """Define a base class that can be extended to both scalable and un-scalable case.
 
-def transform_output(xu_means, xu_std, XU):
-    XUt = []
-    for i in range(XU.shape[1]):
-        XUt.append((XU[:,i] * xu_std[i]) + xu_means[i])
-    return np.vstack(XUt).T
-
-
-class GPytorchGP(Model):
-    """Define a base class that can be extended to both scalable and un-scalable case"""
+    Training is always done in float64.  Passing precision="float32" casts the
+    trained GP down so that prediction runs in single precision.
+    """
     def __init__(self, system, mean='constant', kernel='RBF', niter=40, lr=0.1,
-            use_cuda=True):
+            use_cuda=True, precision="float64"):
         super().__init__(system)
+        if precision not in ["float64", "float32"]:
+            raise ValueError("Unsupported precision: {}".format(precision))
+        self._dtype = getattr(torch, precision)
         self.niter = niter
         self.lr = lr
         self.device = (torch.device('cuda') if (use_cuda and torch.cuda.is_available()) 
@@ -72,52 +70,90 @@ class GPytorchGP(Model):
     def pred(self, state, ctrl):
         X = np.concatenate([state, ctrl])
         X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
+        Xt = self._xu_scaler.transform(X)
         # for this one, make a prediction is easy...
-        TsrXt = torch.from_numpy(Xt).to(self.device)
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
-        out = predy.mean.cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
+        TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
+        with torch.no_grad():
+            out = self._pred_mean(TsrXt).cpu().numpy()
+        dy = self._dy_scaler.inverse_transform(out).flatten()
         return state + dy
 
+    def _cache_terms(self):
+        """
+        Returns (inputs, alpha), of shapes (num_task, N, D) and (num_task, N),
+        such that the posterior mean of each task is
+        mean(x) + K(x, inputs) @ alpha.
+        """
+        raise NotImplementedError
+
+    def _build_prediction_cache(self):
+        """
+        Precompute the posterior mean weights once after training, so that
+        mean prediction for M queries costs O(N M) kernel evaluations
+        instead of a solve against the training data.  The weights are
+        computed in float64 before the GP is cast to the prediction
+        precision.  Also warms the LOVE caches which gpytorch uses for
+        fast predictive variances.
+        """
+        self.gpmodel.double().eval()
+        with torch.no_grad():
+            inputs, alpha = self._cache_terms()
+        self.gpmodel.to(self._dtype)
+        self._pred_cache = (inputs.to(self._dtype), alpha.to(self._dtype))
+        with torch.no_grad(), gpytorch.settings.fast_pred_var():
+            self.gpmodel.likelihood(self.gpmodel(self._pred_cache[0][0, :1]))
+
+    def _pred_mean(self, TsrXt):
+        """
+        Normalized posterior mean at inputs of shape (M, D) from the cached
+        weights, returned with shape (M, num_task).
+        """
+        inputs, alpha = self._pred_cache
+        x = TsrXt.unsqueeze(0).expand(inputs.shape[0], -1, -1)
+        covar = self.gpmodel.covar_module(x, inputs).to_dense()
+        mean = self.gpmodel.mean_module(x) + (covar @ alpha.unsqueeze(-1)).squeeze(-1)
+        return mean.transpose(0, 1)
+
     def get_sampler(self):
         d = self.system.obs_dim
         u = np.random.normal(loc=0, scale=1, size=d).reshape((d, 1)) 
         def sample(state, ctrl):
             X = np.concatenate([state, ctrl])
             X = X[np.newaxis,:]
-            Xt = transform_input(self.xu_means, self.xu_std, X)
+            Xt = self._xu_scaler.transform(X)
             # for this one, make a prediction is easy...
-            TsrXt = torch.from_numpy(Xt).to(self.device)
-            predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
+            TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
+            with torch.no_grad(), gpytorch.settings.fast_pred_var():
+                predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
             #predf = self.gpmodel(TsrXt)
-            mean = predy.mean.cpu().data.reshape((d,1))
-            cov = predy.covariance_matrix.cpu().data
+            mean = predy.mean.cpu().numpy().reshape((d,1))
+            cov = predy.covariance_matrix.cpu().numpy()
             L = np.linalg.cholesky(cov)
             out = mean + np.dot(L, u)
             out = out.reshape((1,d))
             #out2 = predy.sample().cpu().data.numpy()
-            dy = transform_output(self.dy_means, self.dy_std, out).flatten()
+            dy = self._dy_scaler.inverse_transform(out).flatten()
             return state + dy
         return sample
 
     def sample(self, state, ctrl):
         X = np.concatenate([state, ctrl])
         X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
+        Xt = self._xu_scaler.transform(X)
         # for this one, make a prediction is easy...
-        TsrXt = torch.from_numpy(Xt).to(self.device)
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
+        TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
+        with torch.no_grad(), gpytorch.settings.fast_pred_var():
+            predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
         #predf = self.gpmodel(TsrXt)
         d = self.system.obs_dim
-        mean = predy.mean.cpu().data.reshape((d,1))
-        cov = predy.covariance_matrix.cpu().data
+        mean = predy.mean.cpu().numpy().reshape((d,1))
+        cov = predy.covariance_matrix.cpu().numpy()
         L = np.linalg.cholesky(cov)
         u = np.random.normal(loc=0, scale=1, size=d).reshape((d, 1)) 
         out = mean + np.dot(L, u)
         out = out.reshape((1,d))
         #out2 = predy.sample().cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
+        dy = self._dy_scaler.inverse_transform(out).flatten()
         return state + dy
 
     def pred_timeit(self, state, ctrl):
@@ -125,88 +161,83 @@ class GPytorchGP(Model):
         start = time.time()
         X = np.concatenate([state, ctrl])
         X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
+        Xt = self._xu_scaler.transform(X)
         print("time1=", (time.time() - start)*1000, "ms")
         # for this one, make a prediction is easy...
-        TsrXt = torch.from_numpy(Xt).to(self.device)
+        TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
         print("time2=", (time.time() - start)*1000, "ms")
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
+        with torch.no_grad():
+            predy = self._pred_mean(TsrXt)
         print("time3=", (time.time() - start)*1000, "ms")
-        out = predy.mean.cpu().data.numpy()
+        out = predy.cpu().numpy()
         print("time4=", (time.time() - start)*1000, "ms")
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
+        dy = self._dy_scaler.inverse_transform(out).flatten()
         print("time5=", (time.time() - start)*1000, "ms")
         return state + dy
 
     def pred_batch(self, state, ctrl):
         """The batch mode"""
         X = np.concatenate([state, ctrl], axis=1)
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        TsrXt = torch.from_numpy(Xt).to(self.device)
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
-        out = predy.mean.cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
-        return state + dy.reshape((state.shape[0], self.state_dim))
+        Xt = self._xu_scaler.transform(X)
+        TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
+        with torch.no_grad():
+            out = self._pred_mean(TsrXt).cpu().numpy()
+        return state + self._dy_scaler.inverse_transform(out)
 
     def sample_parallel(self, state, ctrl):
         """The batch mode"""
         X = np.concatenate([state, ctrl], axis=1)
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        TsrXt = torch.from_numpy(Xt).to(self.device)
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
-        out = predy.sample().cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
+        Xt = self._xu_scaler.transform(X)
+        TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
+        with torch.no_grad(), gpytorch.settings.fast_pred_var():
+            predy = self.gpmodel.likelihood(self.gpmodel(TsrXt))
+            out = predy.sample().cpu().data.numpy()
+        dy = self._dy_scaler.inverse_transform(out).flatten()
         return state + dy.reshape((state.shape[0], self.state_dim))
 
+    def _pred_mean_jacobian(self, TsrXt):
+        """
+        Normalized posterior mean at inputs of shape (M, D) and its Jacobian.
+        For the RBF kernel k(x, z) = s exp(-|x - z|^2 / 2l^2), the gradient
+        of K(x, Z) @ alpha is -sum_j k(x, z_j) alpha_j (x - z_j) / l^2, so
+        the Jacobian costs one more product with the cached inputs.
+        Returns means of shape (M, num_task) and Jacobians of shape
+        (M, num_task, D).
+        """
+        inputs, alpha = self._pred_cache
+        x = TsrXt.unsqueeze(0).expand(inputs.shape[0], -1, -1)
+        weighted = self.gpmodel.covar_module(x, inputs).to_dense() * alpha.unsqueeze(1)
+        mean = self.gpmodel.mean_module(x) + weighted.sum(-1)
+        lengthscale = self.gpmodel.covar_module.base_kernel.lengthscale
+        jac = (weighted @ inputs - weighted.sum(-1, keepdim=True) * x) / lengthscale**2
+        return mean.transpose(0, 1), jac.transpose(0, 1)
+
     def pred_diff(self, state, ctrl):
         """Prediction, but with gradient information"""
-        X = np.concatenate([state, ctrl])
-        X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        obs_dim = len(state)
-        # get the Tensor
-        TsrXt = torch.from_numpy(Xt).to(self.device)
-        TsrXt = TsrXt.repeat(obs_dim, 1)
-        TsrXt.requires_grad_(True)
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt)).mean
-        predy.backward(torch.eye(obs_dim).to(self.device), retain_graph=True)
-        jac = TsrXt.grad.cpu().data.numpy()
-        # properly scale back...
-        jac = jac / self.xu_std[None] * self.dy_std[:, np.newaxis]
-        # since repeat, y value is the first one...
-        out = predy[:1,:].cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
-        n = self.system.obs_dim
-        state_jac = jac[:, :n] + np.eye(n)
-        ctrl_jac = jac[:, n:]
-        return state + dy, state_jac, ctrl_jac
+        out, state_jacs, ctrl_jacs = self.pred_diff_batch(state[np.newaxis,:],
+                ctrl[np.newaxis,:])
+        return out[0], state_jacs[0], ctrl_jacs[0]
 
-    def pred_diff_parallel(self, state, ctrl):
-        """Prediction, but with gradient information"""
+    def pred_diff_batch(self, state, ctrl):
+        """Batched prediction with the closed-form Jacobian of the posterior mean"""
         X = np.concatenate([state, ctrl], axis=1)
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        obs_dim = state.shape[1]
-        m = state.shape[0]
-        # get the Tensor
-        TsrXt = torch.from_numpy(Xt).to(self.device)
-        TsrXt = TsrXt.repeat(obs_dim, 1, 1).permute(1,0,2).flatten(0,1)
-        TsrXt.requires_grad_(True)
-        predy = self.gpmodel.likelihood(self.gpmodel(TsrXt)).mean
-        predy.backward(torch.eye(obs_dim).to(self.device).repeat(m,1), retain_graph=True)
-        predy = predy.reshape((m, obs_dim, obs_dim))
-        #predy.backward(retain_graph=True)
-        jac = TsrXt.grad.cpu().data.numpy()
-        jac = jac.reshape((m, obs_dim, TsrXt.shape[-1]))
+        Xt = self._xu_scaler.transform(X)
+        TsrXt = torch.from_numpy(Xt).to(self.device, self._dtype)
+        with torch.no_grad():
+            out, jac = self._pred_mean_jacobian(TsrXt)
+        out = out.cpu().numpy().astype(np.float64)
+        jac = jac.cpu().numpy().astype(np.float64)
         # properly scale back...
-        jac = jac / np.tile(self.xu_std, (m,obs_dim,1)) * np.tile(self.dy_std, (m,1))[:,:,np.newaxis]
-        # since repeat, y value is the first one...
-        out = predy[:,0,:].cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out)
+        jac *= self.dy_std[:, np.newaxis] / self.xu_std
+        dy = self._dy_scaler.inverse_transform(out)
         n = self.system.obs_dim
-        state_jacs = jac[:, :, :n] + np.tile(np.eye(n), (m,1,1))
+        state_jacs = jac[:, :, :n] + np.eye(n)
         ctrl_jacs = jac[:, :, n:]
         return state + dy, state_jacs, ctrl_jacs
 
+    def pred_diff_parallel(self, state, ctrl):
+        """Same as pred_diff_batch"""
+        return self.pred_diff_batch(state, ctrl)
 
     @property
     def state_dim(self):
@@ -273,14 +304,111 @@ class ApproximateGPytorchModel(gpytorch.models.ApproximateGP):
 
 
 class LargeGaussianProcess(GPytorchGP):
-    def __init__(self, system, mean='constant', kernel='RBF', niter=40, lr=0.1):
-        super().__init__(system, mean, kernel, niter, lr)
+    """
+    Exact GP with an independent RBF kernel per output.  Small data sets are
+    solved with Cholesky factorizations.  Larger ones use gpytorch's
+    preconditioned conjugate gradients for solves and stochastic Lanczos
+    quadrature for the log determinant, which only need kernel matrix
+    products.  When even the kernel matrix would exceed the memory budget,
+    or the data set exceeds svgp_threshold, training falls back to a
+    variational GP (ApproximateGPModel) and predictions use that instead.
+
+    Parameters
+    ----------
+        solver : str
+            "auto" uses Cholesky up to gpytorch's max_cholesky_size and CG
+            above it, "cholesky" and "cg" force one or the other.
+        cg_tolerance : float
+            Residual tolerance of CG solves during training
+        eval_cg_tolerance : float
+            Residual tolerance of the CG solves for the posterior mean
+            weights and the sampling caches after training.  Much tighter
+            than cg_tolerance, since errors there carry over into every
+            prediction.
+        love_rank : int
+            Rank of the Lanczos decomposition behind the fast predictive
+            variances (LOVE) used by the samplers when solving with CG.
+        max_cg_iterations : int
+            Maximum number of CG iterations
+        preconditioner_rank : int
+            Rank of the pivoted Cholesky preconditioner for CG
+        lanczos_rank : int
+            Number of Lanczos iterations for the log determinant
+        max_memory_mb : float
+            Memory budget for the kernel matrices.  Data sets whose
+            estimated footprint exceeds it are fit with a variational GP.
+        svgp_threshold : int
+            If set, data sets with more transitions are fit with a
+            variational GP.
+        svgp_options : dict
+            Keyword arguments for the fallback ApproximateGPModel
+    """
+    def __init__(self, system, mean='constant', kernel='RBF', niter=40, lr=0.1,
+            solver="auto", cg_tolerance=1.0, eval_cg_tolerance=1e-4,
+            love_rank=300, max_cg_iterations=1000,
+            preconditioner_rank=15, lanczos_rank=20, max_memory_mb=4096,
+            svgp_threshold=None, svgp_options=None, **kwargs):
+        super().__init__(system, mean, kernel, niter, lr, **kwargs)
+        if solver not in ["auto", "cholesky", "cg"]:
+            raise ValueError("Unknown solver: {}".format(solver))
+        self.solver = solver
+        self.cg_tolerance = cg_tolerance
+        self.eval_cg_tolerance = eval_cg_tolerance
+        self.love_rank = love_rank
+        self.max_cg_iterations = max_cg_iterations
+        self.preconditioner_rank = preconditioner_rank
+        self.lanczos_rank = lanczos_rank
+        self.max_memory_mb = max_memory_mb
+        self.svgp_threshold = svgp_threshold
+        self.svgp_options = {} if svgp_options is None else dict(svgp_options)
+        self._gp_kwargs = kwargs
+        self.svgp_model = None
         self.gpmodel = BatchIndependentMultitaskGPModel(self.system.obs_dim, mean, kernel).double()
         self.gpmodel = self.gpmodel.to(self.device)
 
+    def _solver_settings(self):
+        """Context applying the solver options to gpytorch"""
+        if self.solver == "cholesky":
+            max_cholesky_size = np.iinfo(np.int64).max
+        elif self.solver == "cg":
+            max_cholesky_size = 0
+        else:
+            max_cholesky_size = gpytorch.settings.max_cholesky_size.value()
+        stack = contextlib.ExitStack()
+        for setting in [gpytorch.settings.max_cholesky_size(max_cholesky_size),
+                gpytorch.settings.cg_tolerance(self.cg_tolerance),
+                gpytorch.settings.max_cg_iterations(self.max_cg_iterations),
+                gpytorch.settings.max_preconditioner_size(self.preconditioner_rank),
+                gpytorch.settings.max_lanczos_quadrature_iterations(self.lanczos_rank)]:
+            stack.enter_context(setting)
+        return stack
+
+    def kernel_memory_mb(self, num_samples):
+        """
+        Estimated memory for exact GP training on num_samples transitions:
+        the batch of kernel matrices, kept for the backward pass, plus
+        about as much again for their derivative terms.
+        """
+        return 2 * self.system.obs_dim * num_samples**2 * 8 / 2**20
+
+    def use_svgp(self, num_samples):
+        """Whether training on num_samples transitions falls back to SVGP"""
+        if self.svgp_threshold is not None and num_samples > self.svgp_threshold:
+            return True
+        return (self.max_memory_mb is not None
+                and self.kernel_memory_mb(num_samples) > self.max_memory_mb)
+
     def train(self, trajs, silent=False):
+        trajs = as_trajectory_set(trajs)
+        if self.use_svgp(len(trajs.transition_indices)):
+            self._train_svgp(trajs, silent)
+            return
+        self.svgp_model = None
+        if not isinstance(self.gpmodel, BatchIndependentMultitaskGPModel):
+            self.gpmodel = BatchIndependentMultitaskGPModel(self.system.obs_dim,
+                    self.gp_mean, self.gp_kernel).to(self.device)
         # Initialize kernels
-        self.gpmodel.train()
+        self.gpmodel.double().train()
         self.gpmodel.likelihood.train()
 
         optimizer = torch.optim.Adam(self.gpmodel.parameters(), lr=self.lr)  # Includes GaussianLikelihood parameters
@@ -288,17 +416,13 @@ class LargeGaussianProcess(GPytorchGP):
         mll = gpytorch.mlls.ExactMarginalLogLikelihood(self.gpmodel.likelihood, self.gpmodel)
 
         # prepare data
-        X = np.concatenate([traj.obs[:-1,:] for traj in trajs])
-        dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs])
+        X, U, Xnext = trajs.transitions
+        dY = Xnext - X
         XU = np.concatenate((X, U), axis = 1) # stack X and U together
-        self.xu_means = np.mean(XU, axis=0)
-        self.xu_std = np.std(XU, axis=0)
-        XUt = transform_input(self.xu_means, self.xu_std, XU)
+        self._set_stats(*trajs.get_transition_stats())
+        XUt = self._xu_scaler.transform(XU, out=XU)
 
-        self.dy_means = np.mean(dY, axis=0)
-        self.dy_std = np.std(dY, axis=0)
-        dYt = transform_input(self.dy_means, self.dy_std, dY)
+        dYt = self._dy_scaler.transform(dY, out=dY)
 
         # convert into desired tensor
         train_x = torch.from_numpy(XUt)
@@ -307,16 +431,59 @@ class LargeGaussianProcess(GPytorchGP):
         train_y = train_y.to(self.device).contiguous()
         self.gpmodel.set_train_data(train_x, train_y, False)
 
-        for i in range(self.niter):
-            optimizer.zero_grad()
-            output = self.gpmodel(train_x)
-            loss = -mll(output, train_y)
-            loss.backward()
-            print('Iter %d/%d - Loss: %.3f' % (i + 1, self.niter, loss.item()))
-            optimizer.step()
+        with self._solver_settings():
+            for i in range(self.niter):
+                optimizer.zero_grad()
+                output = self.gpmodel(train_x)
+                loss = -mll(output, train_y)
+                loss.backward()
+                if not silent:
+                    print('Iter %d/%d - Loss: %.3f' % (i + 1, self.niter, loss.item()))
+                optimizer.step()
         # training is finished, now go to eval mode
         self.gpmodel.eval()
         self.gpmodel.likelihood.eval()
+        self._build_prediction_cache()
+
+    def _train_svgp(self, trajs, silent):
+        """
+        Fit a variational GP instead, and predict with its GP and cache.
+        """
+        options = dict(self._gp_kwargs, **self.svgp_options)
+        self.svgp_model = ApproximateGPModel(self.system, self.gp_mean,
+                self.gp_kernel, **options)
+        self.svgp_model.train(trajs, silent=silent)
+        self._set_stats(self.svgp_model.xu_means, self.svgp_model.xu_std,
+                self.svgp_model.dy_means, self.svgp_model.dy_std)
+        self.gpmodel = self.svgp_model.gpmodel
+        self._pred_cache = self.svgp_model._pred_cache
+
+    def _build_prediction_cache(self):
+        train_x = self.gpmodel.train_inputs[0]
+        self.gpmodel.set_train_data(train_x.to(self._dtype),
+                self.gpmodel.train_targets.to(self._dtype), False)
+        # The mean weights and the gpytorch caches used by the samplers are
+        # computed once, so solve them with the evaluation tolerance.
+        # linear_operator reads cg_tolerance for every CG solve.
+        with self._solver_settings(), \
+                gpytorch.settings.eval_cg_tolerance(self.eval_cg_tolerance), \
+                gpytorch.settings.cg_tolerance(self.eval_cg_tolerance), \
+                gpytorch.settings.max_root_decomposition_size(self.love_rank):
+            super()._build_prediction_cache()
+
+    def _cache_terms(self):
+        # alpha = (K + noise I)^-1 (y - mean) for each task, with Cholesky
+        # or CG depending on the solver settings
+        train_x = self.gpmodel.train_inputs[0].double()
+        train_y = self.gpmodel.train_targets.double()
+        x = train_x.unsqueeze(0).expand(train_y.shape[1], -1, -1)
+        likelihood = self.gpmodel.likelihood
+        noise = likelihood.task_noises + likelihood.noise
+        covar = self.gpmodel.covar_module(x).add_diagonal(
+                noise.unsqueeze(-1).expand(-1, x.shape[1]))
+        resid = train_y.transpose(0, 1) - self.gpmodel.mean_module(x)
+        alpha = covar.solve(resid.unsqueeze(-1)).squeeze(-1)
+        return x, alpha
 
 
 # this part implements the approximate GP
@@ -330,6 +497,16 @@ class ApproximateGPModelFactory(ModelFactory):
 
     .. _documentation: https://docs.gpytorch.ai/en/v1.1.1/examples/04_Variational_and_Approximate_GPs/SVGP_Regression_CUDA.html 
 
+    Parameters
+
+    - *precision* (Type: str, Choices: ["float64", "float32"], Default: "float64"):
+      Floating point precision used for prediction.  Training is always done in float64.
+    - *induce_init* (Type: str, Choices: ["kmeans", "greedy_variance", "stratified", "first"],
+      Default: "kmeans"): Initialization of the inducing points on the normalized
+      training inputs: mini-batch k-means centers, greedy maximum-variance selection,
+      samples stratified by trajectory and time, or the first samples.
+    - *induce_seed* (Type: int, Default: 0): Random seed for inducing point initialization.
+
     Hyperparameters:
 
     - *induce_count* (Type: int, Lower: 50, Upper: 200, Default: 100): Number of inducing points
@@ -348,27 +525,29 @@ class ApproximateGPModelFactory(ModelFactory):
         return cs
 
 class ApproximateGPModel(GPytorchGP, Model):
-    def __init__(self, system, mean='constant', kernel='RBF', niter=5, lr=0.1, batch_size=1024, induce_count=500, **kwargs):
+    def __init__(self, system, mean='constant', kernel='RBF', niter=5, lr=0.1, batch_size=1024, induce_count=500,
+            induce_init="kmeans", induce_seed=0, **kwargs):
         super().__init__(system, mean, kernel, niter, lr, **kwargs)
+        if induce_init not in ["kmeans", "greedy_variance", "stratified", "first"]:
+            raise ValueError("Unknown inducing point initialization: {}".format(induce_init))
         self.batch_size = batch_size
         self.induce_count = induce_count
+        self.induce_init = induce_init
+        self.induce_seed = induce_seed
 
     def train(self, trajs, silent=False):
         """Given collected trajectories, train the GP to approximate the actual dynamics"""
         # extract transfer pairs from data
-        X = np.concatenate([traj.obs[:-1,:] for traj in trajs])
-        dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
+        trajs = as_trajectory_set(trajs)
+        X, U, Xnext = trajs.transitions
+        dY = Xnext - X
         num_task = dY.shape[1]
         self.num_task = num_task
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs])
         XU = np.concatenate((X, U), axis = 1) # stack X and U together
-        self.xu_means = np.mean(XU, axis=0)
-        self.xu_std = np.std(XU, axis=0)
-        XUt = transform_input(self.xu_means, self.xu_std, XU)
+        self._set_stats(*trajs.get_transition_stats())
+        XUt = self._xu_scaler.transform(XU, out=XU)
 
-        self.dy_means = np.mean(dY, axis=0)
-        self.dy_std = np.std(dY, axis=0)
-        dYt = transform_input(self.dy_means, self.dy_std, dY)
+        dYt = self._dy_scaler.transform(dY, out=dY)
 
         # convert into desired tensor data loader
         train_x = torch.from_numpy(XUt)
@@ -378,7 +557,13 @@ class ApproximateGPModel(GPytorchGP, Model):
         train_dataset = TensorDataset(train_x, train_y)
         train_loader = DataLoader(train_dataset, batch_size=self.batch_size, shuffle=True)
         # construct the approximate GP instance
-        induce = torch.stack([train_x[:self.induce_count] for _ in range(num_task)], dim=0)
+        # each trajectory contributes one transition fewer than its length
+        transition_offsets = np.concatenate([[0],
+            np.cumsum(np.maximum(trajs.lengths - 1, 0))])
+        induce = select_inducing_points(XUt, self.induce_count, self.induce_init,
+                np.random.default_rng(self.induce_seed), transition_offsets)
+        induce = torch.from_numpy(induce).to(self.device)
+        induce = torch.stack([induce for _ in range(num_task)], dim=0)
         self.induce = induce
         self.gpmodel = ApproximateGPytorchModel(induce, num_task, self.gp_mean, self.gp_kernel).double()
         self.gpmodel = self.gpmodel.to(self.device)
@@ -414,6 +599,21 @@ class ApproximateGPModel(GPytorchGP, Model):
         self.gpmodel.eval()
         likelihood.eval()
         self.gpmodel.likelihood = likelihood
+        self._build_prediction_cache()
+
+    def _cache_terms(self):
+        # The whitened variational mean m gives alpha = L^-T m, where
+        # L L^T = K_ZZ + jitter I as in gpytorch's VariationalStrategy
+        strategy = self.gpmodel.variational_strategy.base_variational_strategy
+        inducing = strategy.inducing_points
+        covar = self.gpmodel.covar_module(inducing).to_dense()
+        covar = covar + strategy.jitter_val * torch.eye(covar.shape[-1],
+                dtype=covar.dtype, device=covar.device)
+        chol = torch.linalg.cholesky(covar)
+        mean = strategy._variational_distribution.variational_mean
+        alpha = torch.linalg.solve_triangular(chol.transpose(-1, -2),
+                mean.unsqueeze(-1), upper=True).squeeze(-1)
+        return inducing, alpha
 
     def get_parameters(self):
         return {"gpmodel_state" : self.gpmodel.state_dict(),
@@ -425,17 +625,17 @@ class ApproximateGPModel(GPytorchGP, Model):
                 "num_task" : self.num_task}
 
     def set_parameters(self, params):
-        self.xu_means = params["xu_means"]
-        self.xu_std = params["xu_std"]
-        self.dy_means = params["dy_means"]
-        self.dy_std = params["dy_std"]
+        self._set_stats(params["xu_means"], params["xu_std"],
+                params["dy_means"], params["dy_std"])
         self.induce = params["induce"]
         self.num_task = params["num_task"]
-        self.gpmodel = ApproximateGPModel(self.induce, self.num_task, self.gp_mean, 
-                self.gp_kernel).double()
-        self.gpmodel = self.gpmodel.to(self.device)
+        self.gpmodel = ApproximateGPytorchModel(self.induce, self.num_task, 
+                self.gp_mean, self.gp_kernel)
+        self.gpmodel = self.gpmodel.to(self.device, self._dtype)
         likelihood = gpytorch.likelihoods.MultitaskGaussianLikelihood(
                 num_tasks=self.num_task)
-        likelihood = likelihood.to(self.device)
+        likelihood = likelihood.to(self.device, self._dtype)
         self.gpmodel.likelihood = likelihood
         self.gpmodel.load_state_dict(params["gpmodel_state"])
+        self.gpmodel.eval()
+        self._build_prediction_cache()
@@ -0,0 +1,110 @@
+import numpy as np
+import numpy.linalg as la
+import scipy.linalg as sla
+
+class StreamingLeastSquares:
+    """
+    Least-squares regression W = argmin ||FW - T||^2 + ridge ||W||^2 fitted
+    by accumulating the normal equations F^T F and F^T T over chunks of
+    samples.  Memory use depends only on the number of features and
+    targets, not on the number of samples.
+    """
+    def __init__(self, n_features, n_targets):
+        """
+        Parameters
+        ----------
+            n_features : int
+                Number of regression features
+            n_targets : int
+                Number of regression targets
+        """
+        self.gram = np.zeros((n_features, n_features))
+        self.cross = np.zeros((n_features, n_targets))
+        self.num_samples = 0
+
+    def add(self, features, targets):
+        """
+        Add a chunk of samples.
+
+        Parameters
+        ----------
+            features : numpy array of shape (N, n_features)
+            targets : numpy array of shape (N, n_targets)
+        """
+        self.gram += features.T @ features
+        self.cross += features.T @ targets
+        self.num_samples += features.shape[0]
+
+    def solve(self, ridge=0.0):
+        """
+        Solve the accumulated normal equations with a Cholesky factorization.
+        Without regularization the Gram matrix may be singular, e.g. when a
+        feature is constant, in which case the minimum-norm solution is
+        returned instead.
+
+        Parameters
+        ----------
+            ridge : float
+                Ridge regularization weight
+
+        Returns
+        -------
+            coeffs : numpy array of shape (n_features, n_targets)
+        """
+        gram = self.gram + ridge * np.eye(self.gram.shape[0])
+        try:
+            return sla.cho_solve(sla.cho_factor(gram), self.cross)
+        except la.LinAlgError:
+            return la.lstsq(gram, self.cross, rcond=None)[0]
+
+class RecursiveLeastSquares:
+    """
+    Recursive least squares with exponential forgetting.  Each sample
+    updates the coefficients W and the inverse feature covariance P in
+    O(d^2) for d features, discounting older samples by the forgetting
+    factor so that the fit can track drifting dynamics.
+    """
+    def __init__(self, coeffs, cov=None, forgetting=1.0):
+        """
+        Parameters
+        ----------
+            coeffs : numpy array of shape (n_features, n_targets)
+                Initial coefficients
+            cov : numpy array of shape (n_features, n_features)
+                Initial inverse feature covariance.  Defaults to a large
+                multiple of the identity, i.e. little confidence in coeffs.
+            forgetting : float
+                Forgetting factor in (0, 1].  1 weights all samples equally.
+        """
+        if not 0.0 < forgetting <= 1.0:
+            raise ValueError("forgetting must be in (0, 1]")
+        self.coeffs = np.array(coeffs, dtype=np.float64)
+        if cov is None:
+            cov = 1e4 * np.eye(self.coeffs.shape[0])
+        self.cov = np.array(cov, dtype=np.float64)
+        self.forgetting = forgetting
+
+    @staticmethod
+    def from_gram(gram, coeffs, ridge=0.0, forgetting=1.0):
+        """
+        Continue a batch least-squares fit, whose feature Gram matrix was
+        gram and whose solution was coeffs.
+        """
+        cov = la.pinv(gram + ridge * np.eye(gram.shape[0]), hermitian=True)
+        return RecursiveLeastSquares(coeffs, cov, forgetting)
+
+    def update(self, features, targets):
+        """
+        Update the fit with samples in order.
+
+        Parameters
+        ----------
+            features : numpy array of shape (N, n_features)
+            targets : numpy array of shape (N, n_targets)
+        """
+        for feature, target in zip(features, targets):
+            cov_feature = self.cov @ feature
+            gain = cov_feature / (self.forgetting + feature @ cov_feature)
+            self.coeffs += np.outer(gain, target - feature @ self.coeffs)
+            self.cov -= np.outer(gain, cov_feature)
+            self.cov /= self.forgetting
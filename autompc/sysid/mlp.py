@@ -3,12 +3,13 @@ Just doing system id using multi-layer perceptron.
 The code is similar to GP / RNN.
 The configuration space has to be carefully considered
 """
+import copy
 import itertools
 import numpy as np
 from tqdm import tqdm
 import sys
+import warnings
 import torch
-from torch.utils.data import Dataset, DataLoader
 import ConfigSpace as CS
 import ConfigSpace.hyperparameters as CSH
 import ConfigSpace.conditions as CSC
@@ -16,18 +17,39 @@ import ConfigSpace.conditions as CSC
 from pdb import set_trace
 
 from .model import Model, ModelFactory
+from .numpy_mlp import NumpyMLP
+from .activations import NONLINEARITIES, SELU_SCALE, SELU_ALPHA
+from .standardizer import TransitionNormalization
+from ..trajectory_set import (as_trajectory_set, iter_transition_chunks,
+        compute_transition_stats, check_reiterable)
 
-def transform_input(xu_means, xu_std, XU):
-    XUt = []
-    for i in range(XU.shape[1]):
-        XUt.append((XU[:,i] - xu_means[i]) / xu_std[i])
-    return np.vstack(XUt).T
+def make_nonlin(nonlintype):
+    """Activation module for the given nonlinearity."""
+    if nonlintype == 'relu':
+        return torch.nn.ReLU()
+    elif nonlintype == 'selu':
+        return torch.nn.SELU()
+    elif nonlintype == 'tanh':
+        return torch.nn.Tanh()
+    elif nonlintype == 'sigmoid':
+        return torch.nn.Sigmoid()
+    raise NotImplementedError("Currently supported nonlinearity: {}".format(
+        ", ".join(NONLINEARITIES)))
 
-def transform_output(xu_means, xu_std, XU):
-    XUt = []
-    for i in range(XU.shape[1]):
-        XUt.append((XU[:,i] * xu_std[i]) + xu_means[i])
-    return np.vstack(XUt).T
+def nonlin_grad(nonlintype, y, x):
+    """
+    Derivative of the activation at pre-activation tensor y, output x.
+    Tensor counterpart of `activations.nonlin_grad`.
+    """
+    if nonlintype == 'relu':
+        return (y > 0).to(y.dtype)
+    elif nonlintype == 'selu':
+        return torch.where(y > 0, torch.full_like(y, SELU_SCALE),
+                SELU_SCALE * SELU_ALPHA * torch.exp(y))
+    elif nonlintype == 'tanh':
+        return 1 - x**2
+    elif nonlintype == 'sigmoid':
+        return x * (1 - x)
 
 class ForwardNet(torch.nn.Module):
     def __init__(self, n_in, n_out, hidden_sizes, nonlintype):
@@ -41,16 +63,8 @@ class ForwardNet(torch.nn.Module):
             last_n = size
         # the final one
         self.output_layer = torch.nn.Linear(last_n, n_out)
-        if nonlintype == 'relu':
-            self.nonlin = torch.nn.ReLU()
-        elif nonlintype == 'selu':
-            self.nonlin = torch.nn.SELU()
-        elif nonlintype == 'tanh':
-            self.nonlin = torch.nn.Tanh()
-        elif nonlintype == 'sigmoid':
-            self.nonlin = torch.nn.Sigmoid()
-        else:
-            raise NotImplementedError("Currently supported nonlinearity: relu, tanh, sigmoid")
+        self.nonlintype = nonlintype
+        self.nonlin = make_nonlin(nonlintype)
 
     def forward(self, x):
         for i, lyr in enumerate(self.layers):
@@ -58,20 +72,38 @@ class ForwardNet(torch.nn.Module):
             x = self.nonlin(y)
         return self.output_layer(x)
 
+    def forward_jacobian(self, x):
+        """
+        Evaluate the network and its input Jacobian in one forward pass,
+        propagating the Jacobian layer by layer.
 
-class SimpleDataset(Dataset):
-    def __init__(self, x, y):
-        self.x = x
-        self.y = y
-
-    def __len__(self):
-        return len(self.x)
+        Returns the output, of shape (N, n_out), and the Jacobian, of
+        shape (N, n_out, n_in).
+        """
+        jac = None
+        for i, lyr in enumerate(self.layers):
+            layer = self.layers[lyr]
+            y = layer(x)
+            x = self.nonlin(y)
+            if jac is None:
+                jac = layer.weight.expand(x.shape[0], -1, -1)
+            else:
+                jac = torch.matmul(layer.weight, jac)
+            jac = nonlin_grad(self.nonlintype, y, x).unsqueeze(-1) * jac
+        return self.output_layer(x), torch.matmul(self.output_layer.weight, jac)
 
-    def __getitem__(self, idx):
-        if torch.is_tensor(idx):
-            idx = idx.tolist()
-        return self.x[idx], self.y[idx]
+class ConcatInputNet(torch.nn.Module):
+    """
+    Wraps a ForwardNet so that it takes state and control as separate
+    inputs, letting the whole prediction be traced into a single
+    TorchScript function.
+    """
+    def __init__(self, net):
+        torch.nn.Module.__init__(self)
+        self.net = net
 
+    def forward(self, state, ctrl):
+        return self.net(torch.cat([state, ctrl], dim=-1))
 
 class MLPFactory(ModelFactory):
     """
@@ -83,6 +115,15 @@ class MLPFactory(ModelFactory):
 
     - *n_batch* (Type: int, Default: 64): Training batch size of the neural net.
     - *n_train_iters* (Type: int, Default: 50): Number of training epochs
+    - *stream_chunk_size* (Type: int, Default: None): If set, train by streaming
+      chunks of this many transitions instead of loading the whole data set.
+      See `MLP.train_streaming`.
+    - *precision* (Type: str, Choices: ["float64", "float32"], Default: "float64"):
+      Floating point precision used for prediction.  Training is always done in
+      float64; with "float32" the trained network is cast down for faster inference.
+    - *jit* (Type: bool, Default: False): Compile the trained network, together with
+      input and output normalization, to TorchScript for lower per-call latency.
+      See `MLP.compile`.
 
     Hyperparameters:
 
@@ -134,13 +175,16 @@ class MLPFactory(ModelFactory):
         cs.add_conditions([hidden_cond_2, hidden_cond_3, hidden_cond_4])
         return cs
 
-class MLP(Model):
+class MLP(TransitionNormalization, Model):
     def __init__(self, system, n_hidden_layers=3, hidden_size=128, 
             nonlintype='relu', n_train_iters=50, n_batch=64, lr=1e-3,
             hidden_size_1=None, hidden_size_2=None, hidden_size_3=None,
             hidden_size_4=None, seed=100,
-            use_cuda=True):
+            use_cuda=True, stream_chunk_size=None, precision="float64",
+            jit=False):
         Model.__init__(self, system)
+        if precision not in ["float64", "float32"]:
+            raise ValueError("Unsupported precision: {}".format(precision))
         nx, nu = system.obs_dim, system.ctrl_dim
         n_hidden_layers = int(n_hidden_layers)
         hidden_sizes = [hidden_size] * n_hidden_layers
@@ -160,9 +204,14 @@ class MLP(Model):
         torch.manual_seed(seed)
         self.net = ForwardNet(nx + nu, nx, hidden_sizes, nonlintype)
         self._train_data = (n_train_iters, n_batch, lr)
+        self.stream_chunk_size = stream_chunk_size
         self._device = (torch.device('cuda') if (use_cuda and torch.cuda.is_available()) 
                 else torch.device('cpu'))
-        self.net = self.net.double().to(self._device)
+        self._dtype = getattr(torch, precision)
+        self.net = self.net.to(self._device, self._dtype)
+        self.jit = jit
+        self._infer_net = None
+        self._compiled = None
 
     def traj_to_state(self, traj):
         return traj[-1].obs.copy()
@@ -175,132 +224,214 @@ class MLP(Model):
         return self.system.obs_dim
 
     def train(self, trajs, silent=False, seed=100):
+        if self.stream_chunk_size is not None:
+            self.train_streaming(trajs, self.stream_chunk_size, silent=silent,
+                    seed=seed)
+            return
         torch.manual_seed(seed)
         n_iter, n_batch, lr = self._train_data
-        X = np.concatenate([traj.obs[:-1,:] for traj in trajs])
-        dY = np.concatenate([traj.obs[1:,:] - traj.obs[:-1,:] for traj in trajs])
-        U = np.concatenate([traj.ctrls[:-1,:] for traj in trajs])
+        trajs = as_trajectory_set(trajs)
+        X, U, Xnext = trajs.transitions
+        dY = Xnext - X
         XU = np.concatenate((X, U), axis = 1) # stack X and U together
-        self.xu_means = np.mean(XU, axis=0)
-        self.xu_std = np.std(XU, axis=0)
-        XUt = transform_input(self.xu_means, self.xu_std, XU)
-
-        self.dy_means = np.mean(dY, axis=0)
-        self.dy_std = np.std(dY, axis=0)
-        dYt = transform_input(self.dy_means, self.dy_std, dY)
-        # concatenate data
-        feedX = XUt
-        predY = dYt
-        dataset = SimpleDataset(feedX, predY)
-        dataloader = DataLoader(dataset, batch_size=n_batch, shuffle=True)
-        # now I can perform training... using torch default dataset holder
-        self.net.train()
+        self._set_stats(*trajs.get_transition_stats())
+        self._xu_scaler.transform(XU, out=XU)
+        self._dy_scaler.transform(dY, out=dY)
+        # keep the whole data set on the device, and batch by slicing
+        x_all = torch.from_numpy(XU).to(self._device)
+        y_all = torch.from_numpy(dY).to(self._device)
+        self.net.double().train()
         for param in self.net.parameters():
             param.requires_grad_(True)
         optim = torch.optim.Adam(self.net.parameters(), lr=lr)
         lossfun = torch.nn.SmoothL1Loss()
-        best_loss = float("inf")
-        best_params = None
-        print("Training MLP: ", end="")
-        for i in tqdm(range(n_iter), file=sys.stdout):
-            cum_loss = 0.0
-            for i, (x, y) in enumerate(dataloader):
-                optim.zero_grad()
-                x = x.to(self._device)
-                predy = self.net(x)
-                loss = lossfun(predy, y.to(self._device))
-                loss.backward()
-                cum_loss += loss.item()
-                optim.step()
-        self.net.eval()
+        if silent:
+            itr = range(n_iter)
+        else:
+            print("Training MLP: ", end="")
+            itr = tqdm(range(n_iter), file=sys.stdout)
+        for _ in itr:
+            self._train_epoch(x_all, y_all, n_batch, optim, lossfun)
+        self.net.to(self._dtype).eval()
         for param in self.net.parameters():
             param.requires_grad_(False)
+        self._build_inference_net()
 
-    def pred(self, state, ctrl):
-        X = np.concatenate([state, ctrl])
-        X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
+    def _train_epoch(self, x_all, y_all, n_batch, optim, lossfun):
+        """Run one pass over normalized tensors in shuffled minibatches."""
+        perm = torch.randperm(x_all.shape[0], device=self._device)
+        x_all, y_all = x_all[perm], y_all[perm]
+        for start in range(0, x_all.shape[0], n_batch):
+            x = x_all[start:start+n_batch]
+            y = y_all[start:start+n_batch]
+            optim.zero_grad()
+            loss = lossfun(self.net(x), y)
+            loss.backward()
+            optim.step()
+
+    def train_streaming(self, trajs, chunk_size=65536, silent=False, seed=100):
+        """
+        Train the network without loading the whole data set into memory.
+        Normalization statistics are computed in one streaming pass.  Each
+        epoch then visits the data chunk by chunk; every chunk is normalized
+        and moved to the device as a single tensor, shuffled, and sliced
+        into minibatches.
+
+        Parameters
+        ----------
+            trajs : TrajectorySet, or Function () -> iterable of Trajectory
+                Training data.  The data is read once for the statistics and
+                once per epoch, so pass a function returning a fresh generator
+                rather than the generator itself; a generator raises a
+                TypeError.  Chunks of a TrajectorySet (including memory-mapped
+                stores) are visited in random order.
+            chunk_size : int
+                Approximate number of transitions held in memory at once.
+            silent : bool
+                Silence progress bar output
+            seed : int
+                Random seed for shuffling and initialization
+        """
+        check_reiterable(trajs)
+        torch.manual_seed(seed)
+        rng = np.random.default_rng(seed)
+        n_iter, n_batch, lr = self._train_data
+        self._set_stats(*compute_transition_stats(
+            iter_transition_chunks(trajs, chunk_size)))
+        self.net.double().train()
+        for param in self.net.parameters():
+            param.requires_grad_(True)
+        optim = torch.optim.Adam(self.net.parameters(), lr=lr)
+        lossfun = torch.nn.SmoothL1Loss()
+        if silent:
+            itr = range(n_iter)
+        else:
+            print("Training MLP: ", end="")
+            itr = tqdm(range(n_iter), file=sys.stdout)
+        for _ in itr:
+            for X, U, Xnext in iter_transition_chunks(trajs, chunk_size, rng=rng):
+                XU = self._xu_scaler.transform(np.concatenate((X, U), axis=1))
+                dY = self._dy_scaler.transform(Xnext - X)
+                x_all = torch.from_numpy(XU).to(self._device)
+                y_all = torch.from_numpy(dY).to(self._device)
+                self._train_epoch(x_all, y_all, n_batch, optim, lossfun)
+        self.net.to(self._dtype).eval()
+        for param in self.net.parameters():
+            param.requires_grad_(False)
+        self._build_inference_net()
+
+    def _set_stats(self, xu_means, xu_std, dy_means, dy_std):
+        super()._set_stats(xu_means, xu_std, dy_means, dy_std)
+        self._infer_net = None
+        self._compiled = None
+
+    def _build_inference_net(self):
+        """
+        Copy the trained network for prediction, folding input normalization
+        into its first layer and output denormalization into its last, so
+        that it maps raw (state, ctrl) directly to the state change.
+        """
+        net = copy.deepcopy(self.net)
+        first = next(iter(net.layers.values()))
         with torch.no_grad():
-            xin = torch.from_numpy(Xt).to(self._device)
-            yout = self.net(xin).cpu().numpy()
-        dy = transform_output(self.dy_means, self.dy_std, yout).flatten()
-        return state + dy
+            for layer, fold in [(first, self._xu_scaler.fold_input),
+                    (net.output_layer, self._dy_scaler.fold_output)]:
+                weight, bias = fold(layer.weight.cpu().double().numpy(),
+                        layer.bias.cpu().double().numpy())
+                layer.weight.copy_(torch.from_numpy(weight))
+                layer.bias.copy_(torch.from_numpy(bias))
+        self._infer_net = net
+        if self.jit:
+            self.compile()
+
+    def compile(self):
+        """
+        Trace the trained network, whose normalization is already folded
+        into its weights, into a frozen TorchScript function.  pred and
+        pred_batch use the compiled function until the model is retrained.
+        """
+        module = ConcatInputNet(self._infer_net).eval()
+        example = (torch.zeros((1, self.system.obs_dim), dtype=self._dtype,
+                    device=self._device),
+                torch.zeros((1, self.system.ctrl_dim), dtype=self._dtype,
+                    device=self._device))
+        with torch.no_grad(), warnings.catch_warnings():
+            # Recent PyTorch releases deprecate TorchScript in favor of
+            # torch.compile, and warn on every trace.
+            warnings.simplefilter("ignore", FutureWarning)
+            warnings.simplefilter("ignore", DeprecationWarning)
+            self._compiled = torch.jit.freeze(torch.jit.trace(module, example))
+            # the profiling executor optimizes the graph over the first calls
+            for _ in range(3):
+                self._compiled(*example)
+
+    def export(self):
+        """
+        Snapshot the trained network into a NumpyMLP, which predicts and
+        computes Jacobians with NumPy alone.  Normalization is folded into
+        the first and last layers.
+
+        Returns
+        -------
+            model : NumpyMLP
+        """
+        net = self._infer_net
+        layers = list(net.layers.values()) + [net.output_layer]
+        weights = [lyr.weight.cpu().double().numpy().copy() for lyr in layers]
+        biases = [lyr.bias.cpu().double().numpy().copy() for lyr in layers]
+        return NumpyMLP(self.system, weights, biases, self.net.nonlintype)
+
+    def _pred_compiled(self, state, ctrl):
+        with torch.no_grad():
+            dy = self._compiled(
+                    torch.from_numpy(state).to(self._device, self._dtype),
+                    torch.from_numpy(ctrl).to(self._device, self._dtype))
+        return state + dy.cpu().numpy()
+
+    def pred(self, state, ctrl):
+        return self.pred_batch(state[np.newaxis,:], ctrl[np.newaxis,:])[0]
 
     def pred_batch(self, state, ctrl):
+        if self._compiled is not None:
+            return self._pred_compiled(state, ctrl)
         X = np.concatenate([state, ctrl], axis=1)
-        Xt = transform_input(self.xu_means, self.xu_std, X)
         with torch.no_grad():
-            xin = torch.from_numpy(Xt).to(self._device)
-            yout = self.net(xin).cpu().numpy()
-        dy = transform_output(self.dy_means, self.dy_std, yout).flatten()
-        return state + dy.reshape((state.shape[0], self.state_dim))
+            xin = torch.from_numpy(X).to(self._device, self._dtype)
+            dy = self._infer_net(xin).cpu().numpy()
+        return state + dy
 
-    def pred_diff(self, state, ctrl):
-        """Use code from https://gist.github.com/sbarratt/37356c46ad1350d4c30aefbd488a4faa .
-        
-        def get_batch_jacobian(net, x, to):
-            # noutputs: total output dim (e.g. net(x).shape(b,1,4,4) noutputs=1*4*4
-            # b: batch
-            # i: in_dim
-            # o: out_dim
-            # ti: total input dim
-            # to: total output dim
-            x_batch = x.shape[0]
-            x_shape = x.shape[1:]
-            x = x.unsqueeze(1)  # b, 1 ,i
-            x = x.repeat(1, to, *(1,)*len(x.shape[2:]))  # b * to,i  copy to o dim
-            x.requires_grad_(True)
-            tmp_shape = x.shape
-            y = net(x.reshape(-1, *tmp_shape[2:]))  # x.shape = b*to,i y.shape = b*to,to
-            y_shape = y.shape[1:]  # y.shape = b*to,to
-            y = y.reshape(x_batch, to, to)  # y.shape = b,to,to
-            input_val = torch.eye(to).reshape(1, to, to).repeat(x_batch, 1, 1)  # input_val.shape = b,to,to  value is (eye)
-            y.backward(input_val)  # y.shape = b,to,to
-            return x.grad.reshape(x_batch, *y_shape, *x_shape).data  # x.shape = b,o,i
+    def rollout(self, init_states, ctrl_seqs):
         """
-        X = np.concatenate([state, ctrl])
-        X = X[np.newaxis,:]
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        xin = torch.from_numpy(Xt).to(self._device)
-        n_out = self.system.obs_dim
-        xin = xin.repeat(n_out, 1)
-        xin.requires_grad_(True)
-        yout = self.net(xin)
-        # compute gradient...
-        yout.backward(torch.eye(n_out).to(self._device))
-        jac = xin.grad.cpu().data.numpy()
-        # properly scale back...
-        jac = jac / self.xu_std[None] * self.dy_std[:, np.newaxis]
-        n = self.system.obs_dim
-        state_jac = jac[:, :n] + np.eye(n)
-        ctrl_jac = jac[:, n:]
-        out = yout.detach().cpu().numpy()[:1, :]
-        dy = transform_output(self.dy_means, self.dy_std, out).flatten()
-        return state+dy, state_jac, ctrl_jac
+        Open-loop rollouts computed on the device, converting to and from
+        numpy only once.  States are accumulated in float64 whatever the
+        inference precision.
+        """
+        N, H = ctrl_seqs.shape[:2]
+        with torch.no_grad():
+            ctrls = torch.from_numpy(ctrl_seqs).to(self._device, self._dtype)
+            states = torch.empty((N, H+1, self.state_dim), dtype=torch.float64,
+                    device=self._device)
+            states[:,0,:] = torch.from_numpy(init_states)
+            for k in range(H):
+                x = torch.cat([states[:,k,:].to(self._dtype), ctrls[:,k,:]], dim=-1)
+                states[:,k+1,:] = states[:,k,:] + self._infer_net(x)
+        return states.cpu().numpy()
+
+    def pred_diff(self, state, ctrl):
+        out, state_jacs, ctrl_jacs = self.pred_diff_batch(state[np.newaxis,:],
+                ctrl[np.newaxis,:])
+        return out[0], state_jacs[0], ctrl_jacs[0]
 
     def pred_diff_batch(self, state, ctrl):
         """Prediction, but with gradient information"""
         X = np.concatenate([state, ctrl], axis=1)
-        Xt = transform_input(self.xu_means, self.xu_std, X)
-        obs_dim = state.shape[1]
-        m = state.shape[0]
-        # get the Tensor
-        TsrXt = torch.from_numpy(Xt).to(self._device)
-        TsrXt = TsrXt.repeat(obs_dim, 1, 1).permute(1,0,2).flatten(0,1)
-        TsrXt.requires_grad_(True)
-        predy = self.net(TsrXt)
-        predy.backward(torch.eye(obs_dim).to(self._device).repeat(m,1), retain_graph=True)
-        predy = predy.reshape((m, obs_dim, obs_dim))
-        #predy.backward(retain_graph=True)
-        jac = TsrXt.grad.cpu().data.numpy()
-        jac = jac.reshape((m, obs_dim, TsrXt.shape[-1]))
-        # properly scale back...
-        jac = jac / np.tile(self.xu_std, (m,obs_dim,1)) * np.tile(self.dy_std, (m,1))[:,:,np.newaxis]
-        # since repeat, y value is the first one...
-        out = predy[:,0,:].cpu().data.numpy()
-        dy = transform_output(self.dy_means, self.dy_std, out)
+        with torch.no_grad():
+            xin = torch.from_numpy(X).to(self._device, self._dtype)
+            dy, jac = self._infer_net.forward_jacobian(xin)
+            dy = dy.cpu().numpy()
+            jac = jac.cpu().numpy()
         n = self.system.obs_dim
-        state_jacs = jac[:, :, :n] + np.tile(np.eye(n), (m,1,1))
+        state_jacs = jac[:, :, :n] + np.eye(n)
         ctrl_jacs = jac[:, :, n:]
         return state + dy, state_jacs, ctrl_jacs
 
@@ -314,8 +445,7 @@ class MLP(Model):
 
 
     def set_parameters(self, params):
-        self.xu_means = params["xu_means"]
-        self.xu_std = params["xu_std"]
-        self.dy_means = params["dy_means"]
-        self.dy_std = params["dy_std"]
+        self._set_stats(params["xu_means"], params["xu_std"],
+                params["dy_means"], params["dy_std"])
         self.net.load_state_dict(params["net_state"])
+        self._build_inference_net()
@@ -52,6 +52,91 @@ class ModelFactory(ABC):
         """
         raise NotImplementedError
 
+class LinearRollout:
+    """
+    Closed-form open-loop rollouts of the linear system x_{t+1} = Ax_t + Bu_t.
+    For a horizon H the states are
+
+        x_k = A^k x_0 + sum_{j<k} A^{k-1-j} B u_j,
+
+    so all N paths are evaluated with two matrix products, one against the
+    stacked powers of A and one against the block-Toeplitz map from
+    controls to states.  These matrices are cached by horizon.
+
+    The closed form does more arithmetic than stepping the recursion,
+    about (n + Hm) rather than (n + m) multiply-adds per state entry, but
+    avoids the per-step overhead.  When the extra arithmetic outweighs
+    that overhead, the rollout steps through the recursion instead.
+    """
+    # Per-step overhead of the recursion, in multiply-adds
+    step_overhead = 1e5
+
+    def __init__(self, A, B):
+        self.A = A
+        self.B = B
+        self._cache = dict()
+
+    def get_maps(self, horizon):
+        """
+        Returns (state_map, ctrl_map), of shapes (n, (H+1)n) and
+        (Hm, (H+1)n), such that the flattened states of a rollout are
+        x_0 @ state_map + u.flatten() @ ctrl_map.
+        """
+        if horizon not in self._cache:
+            n, m = self.B.shape
+            powers = np.empty((horizon+1, n, n))
+            powers[0] = np.eye(n)
+            for k in range(horizon):
+                powers[k+1] = self.A @ powers[k]
+            state_map = powers.transpose((2, 0, 1)).reshape((n, (horizon+1)*n))
+            # impulse[k] = A^k B gives the effect of a control k+1 steps later
+            impulse = powers[:-1] @ self.B
+            ctrl_map = np.zeros((horizon, m, horizon+1, n))
+            for j in range(horizon):
+                ctrl_map[j, :, j+1:, :] = impulse[:horizon-j].transpose((2, 0, 1))
+            self._cache[horizon] = (state_map,
+                    ctrl_map.reshape((horizon*m, (horizon+1)*n)))
+        return self._cache[horizon]
+
+    def use_closed_form(self, N, horizon):
+        """Whether N rollouts of the given horizon should use the closed form."""
+        n, m = self.B.shape
+        extra = N * n * ((horizon+1) * (n + horizon*m) - horizon * (n + m))
+        return extra <= horizon * self.step_overhead
+
+    def __call__(self, init_states, ctrl_seqs):
+        """
+        Same argument and return conventions as Model.rollout.
+        """
+        N, H = ctrl_seqs.shape[:2]
+        if not self.use_closed_form(N, H):
+            return self._scan(init_states, ctrl_seqs)
+        state_map, ctrl_map = self.get_maps(H)
+        states = init_states @ state_map
+        states += ctrl_seqs.reshape((N, -1)) @ ctrl_map
+        return states.reshape((N, H+1, -1))
+
+    def _scan(self, init_states, ctrl_seqs):
+        N, H = ctrl_seqs.shape[:2]
+        states = np.empty((N, H+1, self.A.shape[0]))
+        states[:,0,:] = init_states
+        ctrl_terms = ctrl_seqs @ self.B.T
+        for k in range(H):
+            np.matmul(states[:,k,:], self.A.T, out=states[:,k+1,:])
+            states[:,k+1,:] += ctrl_terms[:,k,:]
+        return states
+
+def linear_rollout(model, init_states, ctrl_seqs):
+    """
+    Model.rollout for models with system matrices stored as model.A and
+    model.B.  The model's LinearRollout is kept until A or B is replaced.
+    """
+    engine = getattr(model, "_linear_rollout", None)
+    if engine is None or engine.A is not model.A or engine.B is not model.B:
+        engine = LinearRollout(model.A, model.B)
+        model._linear_rollout = engine
+    return engine(init_states, ctrl_seqs)
+
 class Model(ABC):
     def __init__(self, system):
         self.system = system
@@ -129,6 +214,30 @@ class Model(ABC):
             out[i,:] = self.pred(states[i,:], ctrls[i,:])
         return out
 
+    def rollout(self, init_states, ctrl_seqs):
+        """
+        Predict N open-loop trajectories.  The default implementation calls
+        pred_batch once per time step; models that can propagate several
+        steps more efficiently override this.
+
+        Parameters
+        ----------
+            init_states : Numpy array of size (N, self.state_dim)
+                N initial model states
+            ctrl_seqs : Numpy array of size (N, H, self.system.ctrl_dim)
+                Control sequences applied from each initial state
+        Returns
+        -------
+            states : Numpy array of size (N, H+1, self.state_dim)
+                Predicted model states, starting with init_states
+        """
+        N, H = ctrl_seqs.shape[:2]
+        states = np.empty((N, H+1, self.state_dim))
+        states[:,0,:] = init_states
+        for k in range(H):
+            states[:,k+1,:] = self.pred_batch(states[:,k,:], ctrl_seqs[:,k,:])
+        return states
+
     def pred_diff(self, state, ctrl):
         """
         Run model prediction and compute gradients.
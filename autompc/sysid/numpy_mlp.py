@@ -0,0 +1,120 @@
+"""
+NumPy-only inference engine for trained MLP models.  Evaluating a small
+network one sample at a time is dominated by torch dispatch overhead, so
+MLP.export snapshots the weights into this class, which only depends on
+numpy and can be pickled and loaded without torch.
+"""
+import numpy as np
+
+from .model import Model
+from .activations import check_nonlintype, apply_nonlin, nonlin_grad
+
+class NumpyMLP(Model):
+    """
+    Feed-forward network predictor evaluated with NumPy.  Input
+    normalization is folded into the first layer and output
+    denormalization into the last, so a prediction is just the
+    network's matrix products plus the residual state.  Work buffers for
+    single-sample prediction are allocated once up front.
+
+    Usually created with `MLP.export()`.
+    """
+    def __init__(self, system, weights, biases, nonlintype):
+        """
+        Parameters
+        ----------
+            system : System
+                Robot system
+            weights : List of numpy arrays
+                Layer weight matrices, each of shape (n_out, n_in), with
+                normalization folded into the first and last layers.
+            biases : List of numpy arrays
+                Layer bias vectors
+            nonlintype : str
+                Activation function, one of "relu", "tanh", "sigmoid", "selu"
+        """
+        super().__init__(system)
+        check_nonlintype(nonlintype)
+        self.nonlintype = nonlintype
+        self.set_parameters({"weights" : weights, "biases" : biases})
+
+    def _alloc_buffers(self):
+        n_in = self.system.obs_dim + self.system.ctrl_dim
+        self._xu = np.empty(n_in)
+        self._pre = [np.empty(w.shape[0]) for w in self.weights[:-1]]
+        self._hidden = [np.empty(w.shape[0]) for w in self.weights[:-1]]
+        self._jac = [np.empty((w.shape[0], n_in)) for w in self.weights[:-1]]
+
+    def traj_to_state(self, traj):
+        return traj[-1].obs.copy()
+
+    def update_state(self, state, new_ctrl, new_obs):
+        return new_obs.copy()
+
+    @property
+    def state_dim(self):
+        return self.system.obs_dim
+
+    def _forward(self, state, ctrl):
+        """Single-sample forward pass through the preallocated buffers."""
+        n = self.system.obs_dim
+        x = self._xu
+        x[:n] = state
+        x[n:] = ctrl
+        for w, b, pre, hidden in zip(self.weights, self.biases, self._pre,
+                self._hidden):
+            np.dot(w, x, out=pre)
+            pre += b
+            x = apply_nonlin(self.nonlintype, pre, hidden)
+        return x
+
+    def pred(self, state, ctrl):
+        x = self._forward(state, ctrl)
+        return state + self.weights[-1] @ x + self.biases[-1]
+
+    def pred_batch(self, states, ctrls):
+        x = np.concatenate([states, ctrls], axis=1)
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            y = x @ w.T + b
+            x = apply_nonlin(self.nonlintype, y, y)
+        return states + x @ self.weights[-1].T + self.biases[-1]
+
+    def pred_diff(self, state, ctrl):
+        x = self._forward(state, ctrl)
+        jac = None
+        for w, pre, hidden, buf in zip(self.weights, self._pre, self._hidden,
+                self._jac):
+            if jac is None:
+                buf[:] = w
+            else:
+                np.dot(w, jac, out=buf)
+            buf *= nonlin_grad(self.nonlintype, pre, hidden)[:, np.newaxis]
+            jac = buf
+        jac = self.weights[-1] @ jac
+        n = self.system.obs_dim
+        out = state + self.weights[-1] @ x + self.biases[-1]
+        return out, jac[:, :n] + np.eye(n), jac[:, n:]
+
+    def pred_diff_batch(self, states, ctrls):
+        x = np.concatenate([states, ctrls], axis=1)
+        jac = None
+        for w, b in zip(self.weights[:-1], self.biases[:-1]):
+            y = x @ w.T + b
+            x = apply_nonlin(self.nonlintype, y, np.empty_like(y))
+            jac = w if jac is None else np.matmul(w, jac)
+            jac = nonlin_grad(self.nonlintype, y, x)[:, :, np.newaxis] * jac
+        jac = np.matmul(self.weights[-1], jac)
+        n = self.system.obs_dim
+        out = states + x @ self.weights[-1].T + self.biases[-1]
+        return out, jac[:, :, :n] + np.eye(n), jac[:, :, n:]
+
+    def get_parameters(self):
+        return {"weights" : [np.copy(w) for w in self.weights],
+                "biases" : [np.copy(b) for b in self.biases]}
+
+    def set_parameters(self, params):
+        self.weights = [np.ascontiguousarray(w, dtype=np.float64)
+                for w in params["weights"]]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float64)
+                for b in params["biases"]]
+        self._alloc_buffers()
@@ -0,0 +1,188 @@
+"""
+Gaussian process regression approximated with random Fourier features.
+The RBF kernel is replaced by an explicit D-dimensional feature map, so
+the GP becomes Bayesian linear regression whose training cost is linear
+in the number of samples and whose prediction is a pair of matrix
+products.
+"""
+import numpy as np
+import scipy.linalg as sla
+
+import ConfigSpace as CS
+import ConfigSpace.hyperparameters as CSH
+
+from .model import Model, ModelFactory
+from .least_squares import StreamingLeastSquares
+from .standardizer import Standardizer
+from ..trajectory_set import (as_trajectory_set, iter_transition_chunks,
+        compute_transition_stats, check_reiterable)
+
+class RFFGPFactory(ModelFactory):
+    R"""
+    Random Fourier feature Gaussian process.  The RBF kernel
+    :math:`k(x, x') = \exp(-\|x - x'\|^2 / 2\ell^2)` on normalized state and
+    control is approximated by :math:`\phi(x)^T \phi(x')` with
+    :math:`\phi(x) = \sqrt{2/D} \cos(\Omega x / \ell + b)`, where the rows of
+    :math:`\Omega` are drawn from a standard normal and :math:`b` uniformly
+    from :math:`[0, 2\pi)`.  Each output of the normalized state change is then
+    fit by Bayesian linear regression on :math:`\phi`.  Training accumulates a
+    single :math:`D \times D` Gram matrix over the data, and prediction and
+    Jacobians are one product with the feature weights, so the model is cheap
+    enough for sampling-based controllers such as MPPI.  See
+    https://people.eecs.berkeley.edu/~brecht/papers/07.rah.rec.nips.pdf
+
+    Hyperparameters:
+
+    - *num_features* (Type: int, Low: 50, High: 2000, Default: 500): Number of random
+      Fourier features D.
+    - *lengthscale* (Type: float, Low: 0.1, High: 10, Default: 1.0): RBF kernel
+      lengthscale on the normalized inputs.
+
+    Parameters
+
+    - *noise_var* (Type: float, Default: 1e-2): Observation noise variance of the
+      normalized targets, which also acts as the ridge weight.
+    - *stream_chunk_size* (Type: int, Default: 65536): Number of transitions
+      featurized at once during training.
+    - *seed* (Type: int, Default: 0): Random seed for the feature map.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.Model = RFFGP
+        self.name = "RFFGP"
+
+    def get_configuration_space(self):
+        cs = CS.ConfigurationSpace()
+        num_features = CSH.UniformIntegerHyperparameter("num_features",
+                lower=50, upper=2000, default_value=500, log=True)
+        lengthscale = CSH.UniformFloatHyperparameter("lengthscale",
+                lower=0.1, upper=10.0, default_value=1.0, log=True)
+        cs.add_hyperparameters([num_features, lengthscale])
+        return cs
+
+class RFFGP(Model):
+    def __init__(self, system, num_features=500, lengthscale=1.0, noise_var=1e-2,
+            stream_chunk_size=65536, seed=0):
+        super().__init__(system)
+        if noise_var <= 0:
+            raise ValueError("noise_var must be positive")
+        self.num_features = int(num_features)
+        self.lengthscale = lengthscale
+        self.noise_var = noise_var
+        self.stream_chunk_size = stream_chunk_size
+        self.seed = seed
+
+    def traj_to_state(self, traj):
+        return traj[-1].obs.copy()
+
+    def update_state(self, state, new_ctrl, new_obs):
+        return new_obs.copy()
+
+    @property
+    def state_dim(self):
+        return self.system.obs_dim
+
+    def _features(self, X, omega, phase):
+        """Features of inputs X of shape (N, n_in), of shape (N, D)."""
+        Z = X @ omega.T
+        Z += phase
+        np.cos(Z, out=Z)
+        Z *= np.sqrt(2.0 / omega.shape[0])
+        return Z
+
+    def train(self, trajs, silent=False):
+        """
+        Fit the feature weights.  The data is featurized chunk by chunk, so
+        memory use does not grow with the data set.
+
+        Parameters
+        ----------
+            trajs : TrajectorySet, List of Trajectory, or Function () -> iterable of Trajectory
+                Training data.  A function is called twice, once to compute
+                normalization statistics and once to fit, so it can stream
+                the data from a generator.  A generator passed directly
+                raises a TypeError.
+        """
+        check_reiterable(trajs)
+        if callable(trajs):
+            stats = compute_transition_stats(iter_transition_chunks(trajs,
+                self.stream_chunk_size))
+        else:
+            trajs = as_trajectory_set(trajs)
+            stats = trajs.get_transition_stats()
+        xu_scaler = Standardizer(*stats[:2])
+        dy_scaler = Standardizer(*stats[2:])
+
+        rng = np.random.default_rng(self.seed)
+        n_in = self.system.obs_dim + self.system.ctrl_dim
+        omega = rng.normal(size=(self.num_features, n_in)) / self.lengthscale
+        phase = rng.uniform(0.0, 2 * np.pi, size=self.num_features)
+        lstsq = StreamingLeastSquares(self.num_features, self.system.obs_dim)
+        for X, U, Xnext in iter_transition_chunks(trajs, self.stream_chunk_size):
+            XU = xu_scaler.transform(np.concatenate([X, U], axis=1))
+            lstsq.add(self._features(XU, omega, phase),
+                    dy_scaler.transform(Xnext - X))
+        weights = lstsq.solve(self.noise_var)
+        # Posterior weight covariance is noise_var * inv(gram + noise_var I)
+        precision_chol = sla.cholesky(lstsq.gram
+                + self.noise_var * np.eye(self.num_features), lower=True)
+
+        # Fold normalization into the feature map and the weights
+        omega, phase = xu_scaler.fold_input(omega, phase)
+        weights, bias = dy_scaler.fold_output(weights.T, np.zeros(self.system.obs_dim))
+        self.set_parameters({"omega" : omega, "phase" : phase,
+            "weights" : weights, "bias" : bias, "dy_std" : dy_scaler.std,
+            "precision_chol" : precision_chol})
+
+    def pred(self, state, ctrl):
+        return self.pred_batch(state[np.newaxis,:], ctrl[np.newaxis,:])[0]
+
+    def pred_batch(self, state, ctrl):
+        X = np.concatenate([state, ctrl], axis=1)
+        return state + self._features(X, self.omega, self.phase) @ self.weights.T + self.bias
+
+    def pred_mean_std(self, state, ctrl):
+        """
+        Returns the posterior mean prediction and its standard deviation,
+        each of shape (N, state_dim).  The standard deviation excludes the
+        observation noise.
+        """
+        X = np.concatenate([state, ctrl], axis=1)
+        features = self._features(X, self.omega, self.phase)
+        mean = state + features @ self.weights.T + self.bias
+        half = sla.solve_triangular(self.precision_chol, features.T, lower=True)
+        std = np.sqrt(self.noise_var * np.sum(half**2, axis=0))
+        return mean, std[:, np.newaxis] * self.dy_std
+
+    def pred_diff(self, state, ctrl):
+        out, state_jacs, ctrl_jacs = self.pred_diff_batch(state[np.newaxis,:],
+                ctrl[np.newaxis,:])
+        return out[0], state_jacs[0], ctrl_jacs[0]
+
+    def pred_diff_batch(self, state, ctrl):
+        X = np.concatenate([state, ctrl], axis=1)
+        Z = X @ self.omega.T + self.phase
+        scale = np.sqrt(2.0 / self.num_features)
+        out = state + scale * np.cos(Z) @ self.weights.T + self.bias
+        # d/dx of w^T cos(Omega x + b) is -Omega^T (w * sin(Omega x + b))
+        weighted = -scale * np.sin(Z)[:, np.newaxis, :] * self.weights
+        jac = weighted @ self.omega
+        n = self.system.obs_dim
+        return out, jac[:, :, :n] + np.eye(n), jac[:, :, n:]
+
+    def get_parameters(self):
+        return {"omega" : np.copy(self.omega),
+                "phase" : np.copy(self.phase),
+                "weights" : np.copy(self.weights),
+                "bias" : np.copy(self.bias),
+                "dy_std" : np.copy(self.dy_std),
+                "precision_chol" : np.copy(self.precision_chol)}
+
+    def set_parameters(self, params):
+        self.omega = np.ascontiguousarray(params["omega"])
+        self.phase = np.copy(params["phase"])
+        self.weights = np.ascontiguousarray(params["weights"])
+        self.bias = np.copy(params["bias"])
+        self.dy_std = np.copy(params["dy_std"])
+        self.precision_chol = np.copy(params["precision_chol"])
+        self.num_features = self.omega.shape[0]
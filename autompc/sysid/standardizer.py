@@ -0,0 +1,87 @@
+import numpy as np
+
+class Standardizer:
+    """
+    Fitted per-column affine normalization, x' = (x - means) / std.
+    Transforms broadcast over the rows of the input and can write into a
+    caller-provided buffer, and the normalization can be folded into the
+    adjacent linear layer of a model so that it costs nothing at
+    prediction time.
+    """
+    def __init__(self, means, std):
+        """
+        Parameters
+        ----------
+            means : numpy array of size n
+                Column means
+            std : numpy array of size n
+                Column standard deviations
+        """
+        self.means = np.asarray(means, dtype=np.float64)
+        self.std = np.asarray(std, dtype=np.float64)
+        if self.means.shape != self.std.shape or self.means.ndim != 1:
+            raise ValueError("means and std must be vectors of the same size")
+
+    @staticmethod
+    def fit(data):
+        """
+        Fit a Standardizer to the columns of an (N, n) array.
+        """
+        return Standardizer(np.mean(data, axis=0), np.std(data, axis=0))
+
+    def transform(self, data, out=None):
+        """
+        Normalize data of shape (..., n).  If out is given, the result is
+        written there, which may be data itself.
+        """
+        out = np.subtract(data, self.means, out=out)
+        out /= self.std
+        return out
+
+    def inverse_transform(self, data, out=None):
+        """
+        Undo the normalization of data of shape (..., n).  If out is given,
+        the result is written there, which may be data itself.
+        """
+        out = np.multiply(data, self.std, out=out)
+        out += self.means
+        return out
+
+    def fold_input(self, weight, bias):
+        """
+        Fold the normalization into a following linear layer y = Wx' + b,
+        returning (W, b) such that y = Wx + b on unnormalized x.
+
+        Parameters
+        ----------
+            weight : numpy array of shape (m, n)
+            bias : numpy array of size m
+        """
+        weight = weight / self.std
+        return weight, bias - weight @ self.means
+
+    def fold_output(self, weight, bias):
+        """
+        Fold the inverse normalization into a preceding linear layer
+        x' = Wh + b, returning (W, b) such that x = Wh + b.
+
+        Parameters
+        ----------
+            weight : numpy array of shape (n, m)
+            bias : numpy array of size n
+        """
+        return (weight * self.std[:, np.newaxis],
+                bias * self.std + self.means)
+
+class TransitionNormalization:
+    """
+    Mixin for models which learn the state change from normalized state
+    and control.  Stores the transition statistics, as returned by
+    `TrajectorySet.get_transition_stats`, and the matching input and
+    output Standardizers.
+    """
+    def _set_stats(self, xu_means, xu_std, dy_means, dy_std):
+        self.xu_means, self.xu_std = xu_means, xu_std
+        self.dy_means, self.dy_std = dy_means, dy_std
+        self._xu_scaler = Standardizer(xu_means, xu_std)
+        self._dy_scaler = Standardizer(dy_means, dy_std)
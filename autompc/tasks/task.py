@@ -1,7 +1,12 @@
 # Created by William Edwards (wre2@illinois.edu)
 
+from functools import partial
+
 import numpy as np
 
+def _num_steps_term_cond(num_steps, traj):
+    return len(traj) >= num_steps
+
 class Task:
     """
     Defines a control task to be solved
@@ -49,7 +54,9 @@ class Task:
         num_steps : int
             Maximum number of steps.
         """
-        self._term_cond = lambda traj: len(traj) >= num_steps
+        # Use a partial rather than a lambda so tasks can be pickled
+        # and sent to worker processes.
+        self._term_cond = partial(_num_steps_term_cond, num_steps)
         self._num_steps = num_steps
 
     def has_num_steps(self):
@@ -0,0 +1,418 @@
+import os
+import json
+
+import numpy as np
+
+from .system import System
+from .trajectory import Trajectory
+
+def as_trajectory_set(trajs):
+    """
+    Returns trajs unchanged if it is already a TrajectorySet, otherwise
+    packs the list of trajectories into a new TrajectorySet.
+
+    Parameters
+    ----------
+    trajs : TrajectorySet or List of Trajectory
+        Trajectories to pack
+    """
+    if isinstance(trajs, TrajectorySet):
+        return trajs
+    return TrajectorySet.from_trajs(trajs)
+
+def check_reiterable(trajs):
+    """
+    Raise a TypeError if trajs is a one-shot iterator, such as a generator,
+    which a training method reading the data more than once would exhaust
+    on its first pass.  Pass a function returning a fresh generator instead.
+    """
+    if not callable(trajs) and iter(trajs) is trajs:
+        raise TypeError("Training data is read more than once, so it cannot be "
+                "a generator or iterator.  Pass a function returning one instead.")
+
+def iter_transition_chunks(trajs, chunk_size=65536, rng=None):
+    """
+    Iterate over the transitions of a data set in chunks.
+
+    Parameters
+    ----------
+    trajs : TrajectorySet, iterable of Trajectory, or Function () -> iterable of Trajectory
+        Data source.  TrajectorySets are read with iter_transitions.  Other
+        sources are consumed one trajectory at a time, so a function returning
+        a fresh generator allows the data to be streamed more than once.
+
+    chunk_size : int
+        Approximate number of transitions per chunk.  Chunks from sources
+        other than a TrajectorySet contain whole trajectories, so they
+        may be larger.
+
+    rng : numpy.random.Generator
+        If passed, TrajectorySet chunks are visited in random order.
+
+    Yields
+    ------
+    (X, U, Xnext) : numpy arrays
+        Observations and controls at each transition in the chunk,
+        and the following observations.
+    """
+    if isinstance(trajs, TrajectorySet):
+        yield from trajs.iter_transitions(chunk_size, rng=rng)
+        return
+    if callable(trajs):
+        trajs = trajs()
+    buf = []
+    buf_size = 0
+    for traj in trajs:
+        buf.append(traj)
+        buf_size += len(traj) - 1
+        if buf_size >= chunk_size:
+            yield _stack_transitions(buf)
+            buf = []
+            buf_size = 0
+    if buf_size > 0:
+        yield _stack_transitions(buf)
+
+def _stack_transitions(trajs):
+    X = np.concatenate([traj.obs[:-1] for traj in trajs])
+    U = np.concatenate([traj.ctrls[:-1] for traj in trajs])
+    Xnext = np.concatenate([traj.obs[1:] for traj in trajs])
+    return X, U, Xnext
+
+def compute_transition_stats(chunks):
+    """
+    Compute the mean and standard deviation of the stacked state and
+    control, and of the observation change, in a single streaming pass.
+    Per-chunk moments are merged with the parallel form of Welford's
+    algorithm, so only one chunk is held in memory at a time.
+
+    Parameters
+    ----------
+    chunks : iterable of (X, U, Xnext)
+        Transition chunks, e.g. from iter_transition_chunks
+
+    Returns
+    -------
+    xu_means, xu_std : numpy arrays of size obs_dim + ctrl_dim
+    dy_means, dy_std : numpy arrays of size obs_dim
+    """
+    count = 0
+    mean, m2 = None, None
+    for X, U, Xnext in chunks:
+        if len(X) == 0:
+            continue
+        data = np.concatenate([X, U, Xnext - X], axis=1)
+        chunk_count = data.shape[0]
+        chunk_mean = np.mean(data, axis=0)
+        chunk_m2 = np.sum((data - chunk_mean)**2, axis=0)
+        if count == 0:
+            mean, m2 = chunk_mean, chunk_m2
+        else:
+            total = count + chunk_count
+            delta = chunk_mean - mean
+            mean = mean + delta * chunk_count / total
+            m2 = m2 + chunk_m2 + delta**2 * count * chunk_count / total
+        count += chunk_count
+    if count == 0:
+        raise ValueError("No transitions to compute statistics from")
+    std = np.sqrt(m2 / count)
+    n = X.shape[1] + U.shape[1]
+    return mean[:n], std[:n], mean[n:], std[n:]
+
+def save_trajectory_set(path, trajs):
+    """
+    Save trajectories to an on-disk store which can be reopened with
+    load_trajectory_set.  The store is a directory holding the observations,
+    controls and trajectory offsets as raw .npy files, plus an index.json
+    file describing the system.  Trajectories are written one at a time,
+    so the data set never needs to be held in memory at once.
+
+    Parameters
+    ----------
+    path : str
+        Directory to write.  Created if it does not exist.
+
+    trajs : TrajectorySet or List of Trajectory
+        Trajectories to save.  Must be non-empty.
+    """
+    if len(trajs) == 0:
+        raise ValueError("Cannot save empty list of trajectories")
+    system = trajs[0].system
+    offsets = np.zeros(len(trajs) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(traj) for traj in trajs])
+
+    os.makedirs(path, exist_ok=True)
+    obs = np.lib.format.open_memmap(os.path.join(path, "obs.npy"), mode="w+",
+            dtype=np.float64, shape=(int(offsets[-1]), system.obs_dim))
+    ctrls = np.lib.format.open_memmap(os.path.join(path, "ctrls.npy"), mode="w+",
+            dtype=np.float64, shape=(int(offsets[-1]), system.ctrl_dim))
+    for i, traj in enumerate(trajs):
+        obs[offsets[i]:offsets[i+1]] = traj.obs
+        ctrls[offsets[i]:offsets[i+1]] = traj.ctrls
+    obs.flush()
+    ctrls.flush()
+    del obs, ctrls
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    index = {"observations" : system.observations,
+             "controls" : system.controls,
+             "dt" : system.dt,
+             "num_trajs" : len(trajs),
+             "num_steps" : int(offsets[-1])}
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f)
+
+def load_trajectory_set(path, mmap=True, system=None):
+    """
+    Open a trajectory store written by save_trajectory_set.
+
+    Parameters
+    ----------
+    path : str
+        Store directory
+
+    mmap : bool
+        If True (default), the observation and control arrays are
+        memory-mapped read-only rather than read into memory.  Pages are
+        loaded on demand and shared between processes opening the same
+        store.
+
+    system : System
+        System of the stored trajectories.  If None, a System is
+        reconstructed from the labels saved in the store.
+
+    Returns
+    -------
+    trajs : TrajectorySet
+    """
+    with open(os.path.join(path, "index.json")) as f:
+        index = json.load(f)
+    if system is None:
+        system = System(index["observations"], index["controls"], index["dt"])
+    elif (list(system.observations) != list(index["observations"])
+            or list(system.controls) != list(index["controls"])):
+        raise ValueError("system does not match stored trajectories")
+    mmap_mode = "r" if mmap else None
+    obs = np.load(os.path.join(path, "obs.npy"), mmap_mode=mmap_mode)
+    ctrls = np.load(os.path.join(path, "ctrls.npy"), mmap_mode=mmap_mode)
+    offsets = np.load(os.path.join(path, "offsets.npy"))
+    return TrajectorySet(system, obs, ctrls, offsets)
+
+class TrajectorySet:
+    """
+    The TrajectorySet stores a data set of trajectories column-wise.  The
+    observations and controls of all trajectories are held in two contiguous
+    arrays, and an offsets index records where each trajectory starts.
+
+    A TrajectorySet behaves like a list of Trajectory objects, so it can be
+    passed anywhere a list of trajectories is expected.  Indexing returns
+    trajectories which are views into the underlying arrays.  Transition
+    arrays and statistics used during model training are computed once
+    and cached, so the data set should not be modified after creation.
+    """
+    def __init__(self, system, obs, ctrls, offsets):
+        """
+        Parameters
+        ----------
+        system : System
+            The corresponding robot system
+
+        obs : numpy array of shape (N, system.obs_dim)
+            Observations of all trajectories, stacked in order.
+
+        ctrls : numpy array of shape (N, system.ctrl_dim)
+            Controls of all trajectories, stacked in order.
+
+        offsets : numpy array of size num_trajs + 1
+            Trajectory i occupies rows offsets[i] to offsets[i+1].
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if obs.shape != (offsets[-1], system.obs_dim):
+            raise ValueError("obs is wrong shape")
+        if ctrls.shape != (offsets[-1], system.ctrl_dim):
+            raise ValueError("ctrls is wrong shape")
+        if offsets[0] != 0 or np.any(np.diff(offsets) < 0):
+            raise ValueError("offsets must be non-decreasing and start at 0")
+
+        self._system = system
+        self._obs = obs
+        self._ctrls = ctrls
+        self._offsets = offsets
+        self._cache = dict()
+
+    @staticmethod
+    def from_trajs(trajs):
+        """
+        Create a TrajectorySet by copying a list of trajectories.
+
+        Parameters
+        ----------
+        trajs : List of Trajectory
+            Trajectories to store.  Must be non-empty.
+        """
+        if len(trajs) == 0:
+            raise ValueError("Cannot create TrajectorySet from empty list")
+        system = trajs[0].system
+        offsets = np.zeros(len(trajs) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(traj) for traj in trajs])
+        obs = np.concatenate([traj.obs for traj in trajs])
+        ctrls = np.concatenate([traj.ctrls for traj in trajs])
+        return TrajectorySet(system, obs, ctrls, offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < -len(self) or idx >= len(self):
+            raise IndexError("Trajectory index out of range.")
+        if idx < 0:
+            idx += len(self)
+        start, end = self._offsets[idx], self._offsets[idx+1]
+        return Trajectory(self._system, end - start, self._obs[start:end],
+                self._ctrls[start:end])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __str__(self):
+        return "TrajectorySet, num_trajs={}, num_steps={}, system={}".format(
+                len(self), self.num_steps, self._system)
+
+    @property
+    def system(self):
+        """
+        Get trajectory System object.
+        """
+        return self._system
+
+    @property
+    def obs(self):
+        """
+        Observations of all trajectories as a numpy array of
+        shape (num_steps, self.system.obs_dim)
+        """
+        return self._obs
+
+    @property
+    def ctrls(self):
+        """
+        Controls of all trajectories as a numpy array of
+        shape (num_steps, self.system.ctrl_dim)
+        """
+        return self._ctrls
+
+    @property
+    def offsets(self):
+        """
+        Start index of each trajectory, followed by the total number
+        of time steps.
+        """
+        return self._offsets
+
+    @property
+    def lengths(self):
+        """
+        Number of time steps in each trajectory
+        """
+        return np.diff(self._offsets)
+
+    @property
+    def num_steps(self):
+        """
+        Total number of time steps over all trajectories
+        """
+        return self._offsets[-1]
+
+    @property
+    def transition_indices(self):
+        """
+        Row indices of every time step which has a successor in the same
+        trajectory, i.e. every step except the last of each trajectory.
+        The successor of row i is row i+1.
+        """
+        if "transition_indices" not in self._cache:
+            mask = np.ones(self.num_steps, dtype=bool)
+            ends = self._offsets[1:][self.lengths > 0] - 1
+            mask[ends] = False
+            self._cache["transition_indices"] = np.flatnonzero(mask)
+        return self._cache["transition_indices"]
+
+    @property
+    def transitions(self):
+        """
+        Returns (X, U, Xnext), where X and U are the observations and
+        controls at each transition, and Xnext is the following observation.
+        Computed once and cached.
+        """
+        if "transitions" not in self._cache:
+            idxs = self.transition_indices
+            self._cache["transitions"] = (self._obs[idxs], self._ctrls[idxs],
+                    self._obs[idxs+1])
+        return self._cache["transitions"]
+
+    def iter_transitions(self, chunk_size=65536, rng=None):
+        """
+        Iterate over the transitions in contiguous chunks, without
+        materializing the full transition arrays.  This is the preferred
+        way to read memory-mapped data sets which do not fit in memory.
+
+        Parameters
+        ----------
+        chunk_size : int
+            Maximum number of transitions per chunk.
+
+        rng : numpy.random.Generator
+            If passed, chunks are visited in random order.
+
+        Yields
+        ------
+        (X, U, Xnext) : numpy arrays
+            Transitions taken from the next chunk of time steps
+        """
+        idxs = self.transition_indices
+        starts = np.arange(0, len(idxs), chunk_size)
+        if rng is not None:
+            starts = rng.permutation(starts)
+        for start in starts:
+            chunk = idxs[start:start+chunk_size]
+            lo, hi = chunk[0], chunk[-1] + 2
+            obs = np.asarray(self._obs[lo:hi])
+            ctrls = np.asarray(self._ctrls[lo:hi])
+            local = chunk - lo
+            yield obs[local], ctrls[local], obs[local+1]
+
+    @property
+    def num_transitions(self):
+        """
+        Total number of transitions over all trajectories
+        """
+        return len(self.transition_indices)
+
+    def get_transition_stats(self):
+        """
+        Returns the mean and standard deviation of the stacked state and
+        control at each transition, and of the observation change over each
+        transition.  Computed once and cached.  The statistics are accumulated
+        chunk by chunk, so memory-mapped data is never read in all at once.
+
+        Returns
+        -------
+        xu_means, xu_std : numpy arrays of size obs_dim + ctrl_dim
+        dy_means, dy_std : numpy arrays of size obs_dim
+        """
+        if "transition_stats" not in self._cache:
+            self._cache["transition_stats"] = compute_transition_stats(
+                    self.iter_transitions())
+        return self._cache["transition_stats"]
+
+    def get_obs_stats(self):
+        """
+        Returns the mean and covariance of the observations over all
+        time steps.  Computed once and cached.
+        """
+        if "obs_stats" not in self._cache:
+            self._cache["obs_stats"] = (np.mean(self._obs, axis=0),
+                    np.cov(self._obs, rowvar=0))
+        return self._cache["obs_stats"]
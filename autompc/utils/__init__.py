@@ -1,2 +1,2 @@
 from .make_utils import *
-from .simulation import simulate
+from .simulation import simulate, simulate_batch, simulate_parallel
@@ -1,8 +1,10 @@
 # Standard library library
 import sys
+import copy
+from concurrent.futures import ProcessPoolExecutor
 
 # Internal library includes
-from .. import zeros, extend
+from .. import Trajectory
 
 # External library includes
 import numpy as np
@@ -38,10 +40,16 @@ def simulate(controller, init_obs, term_cond=None, dynamics=None, sim_model=None
     if dynamics is None and sim_model is None:
         raise ValueError("Must specify dynamics function or simulation model")
 
-    sim_traj = zeros(controller.system, 1)
+    system = controller.system
+    # Preallocate storage for the whole run so each step only writes
+    # into the buffers, rather than re-copying the trajectory.
+    obs = np.zeros((max_steps + 1, system.obs_dim))
+    ctrls = np.zeros((max_steps + 1, system.ctrl_dim))
     x = np.copy(init_obs)
-    sim_traj[0].obs[:] = x
-    
+    obs[0, :] = x
+    size = 1
+    sim_traj = Trajectory(system, size, obs[:size], ctrls[:size])
+
     constate = controller.traj_to_state(sim_traj)
     if dynamics is None:
         simstate = sim_model.traj_to_state(sim_traj)
@@ -50,15 +58,199 @@ def simulate(controller, init_obs, term_cond=None, dynamics=None, sim_model=None
     else:
         itr = tqdm(range(max_steps), file=sys.stdout)
     for _  in itr:
-        u, constate = controller.run(constate, sim_traj[-1].obs)
+        u, constate = controller.run(constate, obs[size-1])
         if dynamics is None:
             simstate = sim_model.pred(simstate, u)
-            x = simstate[:controller.system.obs_dim]
+            x = simstate[:system.obs_dim]
         else:
             x = dynamics(x, u)
-        sim_traj[-1].ctrl[:] = u
-        sim_traj = extend(sim_traj, [x], 
-                np.zeros((1, controller.system.ctrl_dim)))
+        ctrls[size-1, :] = u
+        obs[size, :] = x
+        size += 1
+        sim_traj = Trajectory(system, size, obs[:size], ctrls[:size])
         if term_cond is not None and term_cond(sim_traj):
             break
-    return sim_traj
+    return Trajectory(system, size, obs[:size].copy(), ctrls[:size].copy())
+
+def simulate_batch(controllers, init_obs, term_cond=None, dynamics=None, sim_model=None, max_steps=10000, silent=False):
+    """
+    Simulate many closed-loop rollouts in lockstep.  When a simulation model
+    is given, all active rollouts are advanced with a single call to
+    sim_model.pred_batch per step.
+
+    Parameters
+    ----------
+    controllers : List of Controller or Function int -> Controller
+        One controller per rollout, or a factory which is called with
+        the rollout index to create it.  Controllers are stateful, so
+        the same instance should not be shared between rollouts.
+
+    init_obs : numpy array of shape (K, controller.system.obs_dim)
+        Initial observation of each of the K rollouts
+
+    term_cond : Function Trajectory -> bool
+        Function which returns true when termination condition is met.
+        Evaluated separately for each rollout.
+
+    dynamics : Function obs, control -> newobs
+        Function defining system dynamics
+
+    sim_model : Model
+        Simulation model.  Used when dynamics is None
+
+    max_steps : int
+        Maximum number of simulation steps allowed.  Default is 10000.
+
+    silent : bool
+        Suppress output if True.
+
+    Returns
+    -------
+    trajs : List of Trajectory
+        Simulated trajectory for each rollout
+    """
+    if dynamics is None and sim_model is None:
+        raise ValueError("Must specify dynamics function or simulation model")
+
+    init_obs = np.asarray(init_obs)
+    K = init_obs.shape[0]
+    if callable(controllers):
+        controllers = [controllers(i) for i in range(K)]
+    if len(controllers) != K:
+        raise ValueError("Number of controllers must match number of initial observations")
+
+    system = controllers[0].system
+    obs = np.zeros((K, max_steps + 1, system.obs_dim))
+    ctrls = np.zeros((K, max_steps + 1, system.ctrl_dim))
+    obs[:, 0, :] = init_obs
+    size = 1
+    sizes = np.ones(K, dtype=int)
+    active = np.ones(K, dtype=bool)
+
+    constates = []
+    simstates = []
+    for i in range(K):
+        sim_traj = Trajectory(system, size, obs[i, :size], ctrls[i, :size])
+        constates.append(controllers[i].traj_to_state(sim_traj))
+        if dynamics is None:
+            simstates.append(sim_model.traj_to_state(sim_traj))
+    if dynamics is None:
+        simstates = np.array(simstates)
+
+    if silent:
+        itr = range(max_steps)
+    else:
+        itr = tqdm(range(max_steps), file=sys.stdout)
+    for _ in itr:
+        idxs = np.flatnonzero(active)
+        for i in idxs:
+            u, constates[i] = controllers[i].run(constates[i], obs[i, size-1])
+            ctrls[i, size-1, :] = u
+        if dynamics is None:
+            simstates[idxs] = sim_model.pred_batch(simstates[idxs],
+                    ctrls[idxs, size-1, :])
+            obs[idxs, size, :] = simstates[idxs, :system.obs_dim]
+        else:
+            for i in idxs:
+                obs[i, size, :] = dynamics(np.copy(obs[i, size-1]), 
+                        ctrls[i, size-1])
+        size += 1
+        sizes[idxs] = size
+        if term_cond is not None:
+            for i in idxs:
+                sim_traj = Trajectory(system, size, obs[i, :size], ctrls[i, :size])
+                if term_cond(sim_traj):
+                    active[i] = False
+        if not active.any():
+            break
+
+    return [Trajectory(system, sizes[i], obs[i, :sizes[i]].copy(), 
+        ctrls[i, :sizes[i]].copy()) for i in range(K)]
+
+# Per-process state for simulate_parallel.  Set once by _init_worker so the
+# controller, model and task are unpickled once per worker, not per rollout.
+_worker_args = None
+
+def _init_worker(controller, task, sim_model, dynamics, max_steps):
+    global _worker_args
+    _worker_args = (controller, task, sim_model, dynamics, max_steps)
+
+def _run_rollout(init_obs, seed):
+    controller, task, sim_model, dynamics, max_steps = _worker_args
+    np.random.seed(seed)
+    # Share the model and task with the template controller, but give
+    # each rollout fresh controller state.
+    memo = {id(controller.model) : controller.model, id(task) : task}
+    controller = copy.deepcopy(controller, memo)
+    controller.reset()
+    traj = simulate(controller, init_obs, task.term_cond, dynamics=dynamics,
+            sim_model=sim_model, max_steps=max_steps, silent=True)
+    cost = task.get_cost()(traj)
+    return traj, cost
+
+def simulate_parallel(controller, task, init_obs, dynamics=None, sim_model=None, 
+        max_steps=None, seed=0, num_workers=None):
+    """
+    Simulate a controller from many initial observations, distributing
+    rollouts over a pool of worker processes.  This is useful for controllers
+    which cannot be batched with simulate_batch.
+
+    The controller, task, model and dynamics are sent to each worker once, so
+    they must be picklable (in particular, dynamics must be a module-level
+    function).  Rollout i seeds numpy's global random state with seed + i,
+    so results do not depend on how rollouts are scheduled.
+
+    Parameters
+    ----------
+    controller : Controller
+        Controller to simulate.  Each rollout runs on a reset copy.
+
+    task : Task
+        Task providing the termination condition and cost
+
+    init_obs : numpy array of shape (K, controller.system.obs_dim)
+        Initial observation of each rollout
+
+    dynamics : Function obs, control -> newobs
+        Function defining system dynamics
+
+    sim_model : Model
+        Simulation model.  Used when dynamics is None
+
+    max_steps : int
+        Maximum number of simulation steps allowed.  Defaults to
+        task.get_num_steps() if set, otherwise 10000.
+
+    seed : int
+        Base random seed.  Default is 0.
+
+    num_workers : int
+        Number of worker processes.  Default is the number of CPUs.
+        If 1, rollouts are run in the current process.
+
+    Returns
+    -------
+    trajs : List of Trajectory
+        Simulated trajectory for each rollout
+
+    costs : numpy array of size K
+        Task cost of each trajectory
+    """
+    if dynamics is None and sim_model is None:
+        raise ValueError("Must specify dynamics function or simulation model")
+    if max_steps is None:
+        max_steps = task.get_num_steps() if task.has_num_steps() else 10000
+
+    init_args = (controller, task, sim_model, dynamics, max_steps)
+    seeds = [seed + i for i in range(len(init_obs))]
+    if num_workers == 1:
+        _init_worker(*init_args)
+        results = list(map(_run_rollout, init_obs, seeds))
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker,
+                initargs=init_args) as executor:
+            results = list(executor.map(_run_rollout, init_obs, seeds))
+
+    trajs = [traj for traj, _ in results]
+    costs = np.array([cost for _, cost in results])
+    return trajs, costs
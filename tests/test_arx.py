@@ -0,0 +1,100 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import ARX
+
+# External library includes
+import numpy as np
+
+from .test_trajectory_set import make_trajs
+
+class ARXTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        rng = np.random.default_rng(42)
+        self.trajs = make_trajs(self.system, rng, [10, 1, 25, 2, 7])
+
+    def test_training_matrix(self):
+        for history in [1, 2, 4]:
+            model = ARX(self.system, history)
+            matrix, targets = model._get_training_matrix_and_targets(self.trajs)
+            expected = [model._get_feature_vector(traj, t) 
+                    for traj in self.trajs for t in range(1, len(traj))]
+            self.assertTrue(np.array_equal(matrix, np.array(expected)))
+            self.assertTrue(np.array_equal(targets, 
+                np.concatenate([traj.obs[1:] for traj in self.trajs])))
+            self.assertTrue(np.array_equal(model._get_all_feature_vectors(
+                self.trajs[2])[-1], model._get_feature_vector(self.trajs[2])))
+
+    def test_train(self):
+        # Noise-free ARX data is fit exactly
+        rng = np.random.default_rng(0)
+        model = ARX(self.system, 2)
+        coeffs = 0.3 * rng.normal(size=(2, model._get_fvec_size()))
+        for traj in self.trajs:
+            for t in range(1, len(traj)):
+                traj[t].obs[:] = coeffs @ model._get_feature_vector(traj, t)
+        model.train(self.trajs)
+        self.assertTrue(np.allclose(model.coeffs, coeffs))
+
+    def test_partial_fit(self):
+        # With no forgetting, adapting a trained model matches a batch refit
+        model = ARX(self.system, 2)
+        model.train(self.trajs[:3])
+        # Recursive least squares, and the Gram matrix it starts from, are
+        # only set up once adaptation starts
+        self.assertIsNone(model._rls)
+        self.assertIsNone(model._gram)
+        model.partial_fit(self.trajs[3:])
+        self.assertIsNotNone(model._rls)
+        self.assertIsNone(model._gram)
+        model.partial_fit(self.trajs[0])
+        batch = ARX(self.system, 2)
+        batch.train(list(self.trajs[:3]) + list(self.trajs[3:]) + [self.trajs[0]])
+        self.assertTrue(np.allclose(model.coeffs, batch.coeffs))
+
+        # With forgetting, the model tracks a change in the dynamics
+        rng = np.random.default_rng(0)
+        model = ARX(self.system, 2, forgetting=0.9)
+        trajs = make_trajs(self.system, rng, [200])
+        coeffs = 0.3 * rng.normal(size=(2, model._get_fvec_size()))
+        for traj in self.trajs:
+            for t in range(1, len(traj)):
+                traj[t].obs[:] = coeffs @ model._get_feature_vector(traj, t)
+        model.train(self.trajs)
+        A = model.A
+        new_coeffs = coeffs + 0.1 * rng.normal(size=coeffs.shape)
+        for t in range(1, len(trajs[0])):
+            trajs[0][t].obs[:] = new_coeffs @ model._get_feature_vector(trajs[0], t)
+        model.partial_fit(trajs[0])
+        self.assertTrue(np.allclose(model.coeffs, new_coeffs, atol=1e-3))
+        self.assertIsNot(model.A, A)
+
+    def test_structured_propagation(self):
+        rng = np.random.default_rng(0)
+        for history in [1, 2, 5]:
+            model = ARX(self.system, history)
+            model.train(self.trajs)
+            A, B = model.to_linear()
+            states = rng.normal(size=(6, model.state_dim))
+            ctrls = rng.normal(size=(6, 1))
+            self.assertTrue(np.allclose(model.pred_batch(states, ctrls),
+                states @ A.T + ctrls @ B.T))
+            self.assertTrue(np.allclose(model.pred(states[0], ctrls[0]),
+                A @ states[0] + B @ ctrls[0]))
+            obs = rng.normal(size=2)
+            expected = A @ states[0] + B @ ctrls[0]
+            expected[:2] = obs
+            self.assertTrue(np.allclose(model.update_state(states[0], ctrls[0],
+                obs), expected))
+            rollout = model.rollout(states, rng.normal(size=(6, 4, 1)))
+            self.assertEqual(rollout.shape, (6, 5, model.state_dim))
+
+            _, jac = model.pred_diff_structured(states[0], ctrls[0])
+            self.assertTrue(np.allclose(jac.dot(states, ctrls),
+                states @ A.T + ctrls @ B.T))
+            state_adj, ctrl_adj = jac.rdot(states)
+            self.assertTrue(np.allclose(state_adj, states @ A))
+            self.assertTrue(np.allclose(ctrl_adj, states @ B))
@@ -0,0 +1,93 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import EnsembleMLP, EnsembleMLPFactory, MLPFactory
+from autompc.evaluation.model_metrics import get_model_rmse
+
+# External library includes
+import numpy as np
+import torch
+
+from .test_mlp import uniform_random_generate
+
+class EnsembleMLPTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=40)
+        self.holdout = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=5)
+        self.model = EnsembleMLP(self.system, n_hidden_layers=2, hidden_size=32,
+                n_train_iters=10, use_cuda=False, n_members=4)
+        self.model.train(self.trajs, silent=True)
+
+    def test_train(self):
+        baseline = np.sqrt(np.mean([np.sum((traj.obs[1:] - traj.obs[:-1])**2, axis=1)
+            for traj in self.holdout]))
+        self.assertLess(get_model_rmse(self.model, self.holdout), baseline)
+
+    def test_members(self):
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        preds = self.model.pred_members(obs, ctrls)
+        self.assertEqual(preds.shape, (4,) + obs.shape)
+        mean, std = self.model.pred_mean_std(obs, ctrls)
+        self.assertTrue(np.allclose(self.model.pred_batch(obs, ctrls), mean))
+        self.assertTrue(np.all(std > 0))
+        # Each member matches an unbatched evaluation of its own weights
+        net = self.model.net
+        xu = (np.concatenate([obs, ctrls], axis=1) - self.model.xu_means) \
+                / self.model.xu_std
+        for e in range(4):
+            x = torch.from_numpy(xu)
+            for w, b in zip(net.weights[:-1], net.biases[:-1]):
+                x = net.nonlin(x @ w[e].T + b[e])
+            dy = (x @ net.weights[-1][e].T + net.biases[-1][e]).numpy()
+            self.assertTrue(np.allclose(preds[e],
+                obs + dy * self.model.dy_std + self.model.dy_means))
+
+    def test_pred_diff(self):
+        state, ctrl = self.holdout[0].obs[3], self.holdout[0].ctrls[3]
+        pred, state_jac, ctrl_jac = self.model.pred_diff(state, ctrl)
+        self.assertTrue(np.allclose(pred, self.model.pred(state, ctrl)))
+        eps = 1e-6
+        for i in range(2):
+            dstate = np.zeros(2)
+            dstate[i] = eps
+            fd = (self.model.pred(state + dstate, ctrl) 
+                    - self.model.pred(state - dstate, ctrl)) / (2 * eps)
+            self.assertTrue(np.allclose(state_jac[:, i], fd, atol=1e-5))
+        fd = (self.model.pred(state, ctrl + eps) 
+                - self.model.pred(state, ctrl - eps)) / (2 * eps)
+        self.assertTrue(np.allclose(ctrl_jac[:, 0], fd, atol=1e-5))
+
+    def test_integer_inputs(self):
+        states, ctrls = np.array([[1, 0], [0, -1]]), np.array([[1], [0]])
+        fstates, fctrls = states.astype(np.float64), ctrls.astype(np.float64)
+        self.assertTrue(np.allclose(self.model.pred_batch(states, ctrls),
+            self.model.pred_batch(fstates, fctrls)))
+        for out, fout in zip(self.model.pred_diff_batch(states, ctrls),
+                self.model.pred_diff_batch(fstates, fctrls)):
+            self.assertTrue(np.allclose(out, fout))
+        self.assertTrue(np.allclose(self.model.rollout(states, ctrls[:, np.newaxis]),
+            self.model.rollout(fstates, fctrls[:, np.newaxis])))
+
+    def test_factory(self):
+        factory = EnsembleMLPFactory(self.system, n_members=3, n_train_iters=2,
+                use_cuda=False)
+        # MLP-only options such as jit are not documented for the ensemble
+        self.assertNotIsInstance(factory, MLPFactory)
+        cfg = factory.get_configuration_space().get_default_configuration()
+        self.assertEqual(cfg, MLPFactory(self.system).get_configuration_space()
+                .get_default_configuration())
+        model = factory(cfg, self.trajs, silent=True)
+        self.assertEqual(model.n_members, 3)
+        params = model.get_parameters()
+        copy = factory(cfg, self.trajs, skip_train_model=True)
+        copy.set_parameters(params)
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        self.assertTrue(np.allclose(copy.pred_batch(obs, ctrls),
+            model.pred_batch(obs, ctrls)))
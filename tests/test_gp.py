@@ -0,0 +1,174 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import ApproximateGPModel
+from autompc.sysid.largegp import LargeGaussianProcess
+from autompc.evaluation.model_metrics import get_model_rmse
+
+# External library includes
+import numpy as np
+import torch
+import gpytorch
+
+from .test_mlp import uniform_random_generate
+
+def check_pred_diff_batch(test, model, rng, eps=1e-6):
+    states, ctrls = rng.normal(size=(10, 2)), rng.normal(size=(10, 1))
+    preds, state_jacs, ctrl_jacs = model.pred_diff_batch(states, ctrls)
+    test.assertTrue(np.allclose(preds, model.pred_batch(states, ctrls)))
+    for i in range(2):
+        step = eps * np.eye(2)[i]
+        fd = (model.pred_batch(states + step, ctrls)
+                - model.pred_batch(states - step, ctrls)) / (2 * eps)
+        test.assertTrue(np.allclose(state_jacs[:, :, i], fd, atol=1e-6))
+    fd = (model.pred_batch(states, ctrls + eps)
+            - model.pred_batch(states, ctrls - eps)) / (2 * eps)
+    test.assertTrue(np.allclose(ctrl_jacs[:, :, 0], fd, atol=1e-6))
+    pred, state_jac, ctrl_jac = model.pred_diff(states[3], ctrls[3])
+    test.assertTrue(np.allclose(state_jac, state_jacs[3]))
+
+class ApproximateGPTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=10)
+        self.holdout = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=5)
+
+    def make_model(self, **kwargs):
+        torch.manual_seed(0)
+        model = ApproximateGPModel(self.system, niter=3, induce_count=50,
+                batch_size=128, use_cuda=False, **kwargs)
+        model.train(self.trajs, silent=True)
+        return model
+
+    def test_precision(self):
+        model64 = self.make_model()
+        model32 = self.make_model(precision="float32")
+        self.assertEqual(model32.induce.dtype, torch.float64)
+        self.assertEqual(next(model32.gpmodel.parameters()).dtype, torch.float32)
+        rmse64 = get_model_rmse(model64, self.holdout)
+        rmse32 = get_model_rmse(model32, self.holdout)
+        # The cached mean weights are computed in float64 before casting
+        self.assertLess(abs(rmse32 - rmse64), 1e-3 * rmse64)
+
+        pred, state_jac, ctrl_jac = model32.pred_diff(self.holdout[0].obs[0],
+                self.holdout[0].ctrls[0])
+        self.assertEqual(state_jac.shape, (2, 2))
+
+        params = model32.get_parameters()
+        model = ApproximateGPModel(self.system, use_cuda=False, precision="float32")
+        model.set_parameters(params)
+        self.assertTrue(np.allclose(model.pred_batch(self.holdout[0].obs,
+            self.holdout[0].ctrls), model32.pred_batch(self.holdout[0].obs,
+                self.holdout[0].ctrls)))
+
+    def test_prediction_cache(self):
+        model = self.make_model()
+        rng = np.random.default_rng(0)
+        states, ctrls = rng.normal(size=(20, 2)), rng.normal(size=(20, 1))
+        X = model._xu_scaler.transform(np.concatenate([states, ctrls], axis=1))
+        with torch.no_grad():
+            mean = model.gpmodel.likelihood(model.gpmodel(
+                torch.from_numpy(X))).mean.numpy()
+        self.assertTrue(np.allclose(model.pred_batch(states, ctrls),
+            states + model._dy_scaler.inverse_transform(mean)))
+        self.assertTrue(np.allclose(model.pred(states[0], ctrls[0]),
+            model.pred_batch(states, ctrls)[0]))
+        self.assertEqual(model.sample_parallel(states, ctrls).shape, (20, 2))
+
+    def test_pred_diff_batch(self):
+        check_pred_diff_batch(self, self.make_model(), np.random.default_rng(0))
+
+    def test_integer_inputs(self):
+        model = self.make_model()
+        states, ctrls = np.array([[1, 0], [0, -1]]), np.array([[1], [0]])
+        fstates, fctrls = states.astype(np.float64), ctrls.astype(np.float64)
+        self.assertTrue(np.allclose(model.pred_batch(states, ctrls),
+            model.pred_batch(fstates, fctrls)))
+        self.assertTrue(np.allclose(model.pred(states[0], ctrls[0]),
+            model.pred(fstates[0], fctrls[0])))
+        for out, fout in zip(model.pred_diff_batch(states, ctrls),
+                model.pred_diff_batch(fstates, fctrls)):
+            self.assertTrue(np.allclose(out, fout))
+        self.assertEqual(model.sample_parallel(states, ctrls).shape, states.shape)
+
+class LargeGaussianProcessTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=30,
+                n_trajs=4)
+
+    def test_prediction_cache(self):
+        torch.manual_seed(0)
+        model = LargeGaussianProcess(self.system, niter=3, use_cuda=False)
+        model.train(self.trajs)
+        rng = np.random.default_rng(0)
+        states, ctrls = rng.normal(size=(20, 2)), rng.normal(size=(20, 1))
+        X = model._xu_scaler.transform(np.concatenate([states, ctrls], axis=1))
+        with torch.no_grad(), gpytorch.settings.max_cholesky_size(10000):
+            mean = model.gpmodel.likelihood(model.gpmodel(
+                torch.from_numpy(X))).mean.numpy()
+        self.assertTrue(np.allclose(model.pred_batch(states, ctrls),
+            states + model._dy_scaler.inverse_transform(mean)))
+        pred, state_jac, ctrl_jac = model.pred_diff(states[0], ctrls[0])
+        self.assertTrue(np.allclose(pred, model.pred(states[0], ctrls[0])))
+        self.assertEqual(model.sample(states[0], ctrls[0]).shape, (2,))
+        check_pred_diff_batch(self, model, rng)
+
+    def test_solvers(self):
+        # With default settings, the CG solve for the cached mean weights
+        # matches a dense Cholesky solve
+        rng = np.random.default_rng(0)
+        states, ctrls = rng.normal(size=(20, 2)), rng.normal(size=(20, 1))
+        trajs = uniform_random_generate(self.system, rng, traj_len=100,
+                n_trajs=8)
+        torch.manual_seed(0)
+        model = LargeGaussianProcess(self.system, niter=3, use_cuda=False,
+                solver="cg")
+        model.train(trajs, silent=True)
+
+        def draw_samples():
+            np.random.seed(0)
+            samples = [model.sample(s, u) for s, u in zip(states, ctrls)]
+            np.random.seed(0)
+            sampler = model.get_sampler()
+            samples += [sampler(s, u) for s, u in zip(states, ctrls)]
+            torch.manual_seed(0)
+            return np.concatenate([samples, model.sample_parallel(states, ctrls)])
+
+        alpha = model._pred_cache[1]
+        preds = model.pred_batch(states, ctrls)
+        samples = draw_samples()
+        model.solver = "cholesky"
+        model._build_prediction_cache()
+        dense_alpha = model._pred_cache[1]
+        self.assertLess(torch.norm(alpha - dense_alpha) / torch.norm(dense_alpha),
+                1e-3)
+        self.assertTrue(np.allclose(preds, model.pred_batch(states, ctrls),
+            atol=1e-3 * np.max(model.dy_std)))
+        # The sampling caches are also built with the evaluation settings
+        self.assertTrue(np.allclose(samples, draw_samples(),
+            atol=1e-3 * np.max(model.dy_std)))
+
+    def test_svgp_fallback(self):
+        model = LargeGaussianProcess(self.system, niter=3, use_cuda=False,
+                svgp_threshold=50, svgp_options={"induce_count" : 20})
+        self.assertFalse(model.use_svgp(50))
+        self.assertTrue(model.use_svgp(51))
+        model.train(self.trajs, silent=True)
+        self.assertIsNotNone(model.svgp_model)
+        self.assertEqual(model.svgp_model.induce_count, 20)
+        rng = np.random.default_rng(0)
+        check_pred_diff_batch(self, model, rng)
+        model.svgp_threshold = None
+        model.train(self.trajs, silent=True)
+        self.assertIsNone(model.svgp_model)
+        check_pred_diff_batch(self, model, rng)
+        self.assertTrue(model.use_svgp(10**6))
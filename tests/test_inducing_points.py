@@ -0,0 +1,63 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+from autompc.sysid.inducing_points import select_inducing_points
+
+# External library includes
+import numpy as np
+
+class InducingPointsTest(unittest.TestCase):
+    def setUp(self):
+        # Two well-separated clusters, listed one after the other
+        rng = np.random.default_rng(0)
+        self.X = np.concatenate([rng.normal(size=(500, 3)),
+            rng.normal(size=(500, 3)) + 10.0])
+
+    def test_methods(self):
+        for method in ["kmeans", "greedy_variance", "stratified", "first"]:
+            points = select_inducing_points(self.X, 10, method,
+                    np.random.default_rng(1))
+            self.assertEqual(points.shape, (10, 3))
+            n_second = np.sum(points[:, 0] > 5.0)
+            if method == "first":
+                self.assertEqual(n_second, 0)
+            else:
+                self.assertGreater(n_second, 0)
+                self.assertLess(n_second, 10)
+        points = select_inducing_points(self.X, 10, "greedy_variance",
+                np.random.default_rng(1))
+        self.assertEqual(len(np.unique(points, axis=0)), 10)
+
+    def test_stratified(self):
+        # Short trajectories still get points, long ones get more
+        offsets = np.array([0, 600, 603, 605, 1000])
+        points = select_inducing_points(self.X, 20, "stratified",
+                offsets=offsets)
+        self.assertEqual(points.shape, (20, 3))
+        rows = [np.flatnonzero((self.X == p).all(axis=1))[0] for p in points]
+        counts = np.histogram(rows, bins=offsets)[0]
+        self.assertTrue(np.all(counts >= 1))
+        self.assertTrue(np.array_equal(counts, [11, 1, 1, 7]))
+        self.assertEqual(len(set(rows)), 20)
+
+        # Fewer points than trajectories takes one from evenly spaced ones
+        offsets = np.arange(0, 1001, 100)
+        points = select_inducing_points(self.X, 5, "stratified",
+                offsets=offsets)
+        rows = [np.flatnonzero((self.X == p).all(axis=1))[0] for p in points]
+        self.assertEqual(len(np.unique(np.array(rows) // 100)), 5)
+
+    def test_duplicate_rows(self):
+        X = np.tile(self.X[:3], (20, 1))
+        points = select_inducing_points(X, 10, "greedy_variance",
+                np.random.default_rng(1))
+        self.assertEqual(points.shape, (3, 3))
+        self.assertTrue(np.all(np.isfinite(points)))
+        self.assertEqual(len(np.unique(points, axis=0)), 3)
+
+    def test_small_data(self):
+        points = select_inducing_points(self.X[:5], 10, "kmeans")
+        self.assertTrue(np.array_equal(points, self.X[:5]))
+        with self.assertRaises(ValueError):
+            select_inducing_points(self.X, 10, "random")
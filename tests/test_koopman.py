@@ -0,0 +1,99 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import Koopman
+
+# External library includes
+import numpy as np
+
+from .test_mlp import uniform_random_generate
+
+def lift_row(obs, poly_degree, trig_freq, product_terms):
+    features = list(obs)
+    for d in range(2, 1+poly_degree):
+        features += list(obs**d)
+    for f in range(1, 1+trig_freq):
+        features += list(np.sin(f*obs)) + list(np.cos(f*obs))
+    if product_terms:
+        features += [features[i] * features[j] for i in range(len(features))
+                for j in range(i+1, len(features))]
+    return np.array(features)
+
+class KoopmanTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=20)
+
+    def test_lifting(self):
+        obs = self.trajs[0].obs
+        for poly_degree, trig_freq, product_terms in [(1, 0, False),
+                (3, 0, False), (1, 2, False), (3, 2, "true"), (2, 1, True)]:
+            model = Koopman(self.system, "lstsq", 
+                    poly_basis=poly_degree > 1, poly_degree=poly_degree,
+                    trig_basis=trig_freq > 0, trig_freq=trig_freq,
+                    product_terms=product_terms)
+            expected = np.array([lift_row(row, poly_degree, trig_freq, 
+                product_terms) for row in obs])
+            states = model.traj_to_states(self.trajs[0])
+            self.assertEqual(states.shape, (len(obs), model.state_dim))
+            self.assertTrue(np.allclose(states, expected))
+            self.assertTrue(np.allclose(model.traj_to_state(self.trajs[0]),
+                expected[-1]))
+            self.assertTrue(np.allclose(model.update_state(None, None, obs[3]),
+                expected[3]))
+
+    def test_train(self):
+        model = Koopman(self.system, "lstsq", poly_basis="true", poly_degree=2,
+                trig_basis="true", trig_freq=1)
+        model.train(self.trajs)
+        self.assertEqual(model.A.shape, (model.state_dim, model.state_dim))
+        self.assertEqual(model.B.shape, (model.state_dim, 1))
+        # The double integrator is linear, so the identity block is recovered
+        states = model.traj_to_states(self.trajs[0])
+        preds = model.pred_batch(states[:-1], self.trajs[0].ctrls[:-1])
+        self.assertTrue(np.allclose(preds[:,:2], self.trajs[0].obs[1:], atol=1e-6))
+
+    def test_train_streaming(self):
+        model = Koopman(self.system, "lstsq", poly_basis="true", poly_degree=2)
+        model.train(self.trajs)
+        stream_model = Koopman(self.system, "lstsq", poly_basis="true",
+                poly_degree=2, stream_chunk_size=100)
+        stream_model.train(lambda: iter(self.trajs))
+        self.assertTrue(np.allclose(stream_model.A, model.A, atol=1e-6))
+        self.assertTrue(np.allclose(stream_model.B, model.B, atol=1e-6))
+
+        ridge_model = Koopman(self.system, "lstsq", poly_basis="true",
+                poly_degree=2, stream_chunk_size=100, ridge=1e3)
+        ridge_model.train(self.trajs)
+        self.assertLess(np.linalg.norm(ridge_model.A), np.linalg.norm(model.A))
+        with self.assertRaises(ValueError):
+            Koopman(self.system, "lasso", stream_chunk_size=100)
+
+    def test_partial_fit(self):
+        kwargs = dict(poly_basis="true", poly_degree=2)
+        model = Koopman(self.system, "lstsq", **kwargs)
+        model.train(self.trajs[:10])
+        for traj in self.trajs[10:]:
+            model.partial_fit(traj)
+        batch = Koopman(self.system, "lstsq", **kwargs)
+        batch.train(self.trajs)
+        self.assertTrue(np.allclose(model.A, batch.A, atol=1e-6))
+        self.assertTrue(np.allclose(model.B, batch.B, atol=1e-6))
+
+        # Recursive least squares only continues a least-squares fit
+        model = Koopman(self.system, "lasso", lasso_alpha=1e-3)
+        model.train(self.trajs[:10])
+        with self.assertRaises(ValueError):
+            model.partial_fit(self.trajs[10])
+
+        # An untrained model learns the linear dynamics from scratch
+        model = Koopman(self.system, "lstsq", forgetting=0.95)
+        model.partial_fit(self.trajs)
+        states = model.traj_to_states(self.trajs[0])
+        preds = model.pred_batch(states[:-1], self.trajs[0].ctrls[:-1])
+        self.assertTrue(np.allclose(preds, self.trajs[0].obs[1:], atol=1e-4))
@@ -0,0 +1,226 @@
+# Standard library includes
+import unittest
+import pickle
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+
+# Internal library includes
+import autompc as ampc
+from autompc import TrajectorySet
+from autompc.sysid import MLP, NumpyMLP
+from autompc.evaluation.model_metrics import get_model_rmse
+
+# External library includes
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+
+def dt_doubleint_dynamics(y, u, dt=0.05):
+    return np.array([y[0] + dt * y[1], y[1] + dt * u[0]])
+
+def uniform_random_generate(system, rng, traj_len, n_trajs):
+    trajs = []
+    for _ in range(n_trajs):
+        y = rng.uniform(-1, 1, system.obs_dim)
+        traj = ampc.zeros(system, traj_len)
+        for i in range(traj_len):
+            traj[i].obs[:] = y
+            u = rng.uniform(-1, 1, system.ctrl_dim)
+            y = dt_doubleint_dynamics(y, u)
+            traj[i].ctrl[:] = u
+        trajs.append(traj)
+    return trajs
+
+class SimpleDataset(Dataset):
+    # Per-sample dataset formerly used by MLP.train, kept as a reference
+    # for the whole-tensor batching in MLP._train_epoch.
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, idx):
+        return self.x[idx], self.y[idx]
+
+class MLPTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=40)
+        self.holdout = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=5)
+
+    def make_model(self, **kwargs):
+        return MLP(self.system, n_hidden_layers=2, hidden_size=32,
+                n_train_iters=10, use_cuda=False, **kwargs)
+
+    def test_train(self):
+        model = self.make_model()
+        model.train(self.trajs, silent=True)
+        # Should do better than predicting no change
+        baseline = np.sqrt(np.mean([np.sum((traj.obs[1:] - traj.obs[:-1])**2, axis=1)
+            for traj in self.holdout]))
+        self.assertLess(get_model_rmse(model, self.holdout), baseline)
+
+    def test_train_streaming(self):
+        model = self.make_model(stream_chunk_size=300)
+        trajset = TrajectorySet.from_trajs(self.trajs)
+        model.train(trajset, silent=True)
+        xu_means, xu_std, dy_means, dy_std = trajset.get_transition_stats()
+        self.assertTrue(np.allclose(model.xu_means, xu_means))
+        self.assertTrue(np.allclose(model.dy_std, dy_std))
+        stream_rmse = get_model_rmse(model, self.holdout)
+
+        gen_model = self.make_model()
+        gen_model.train_streaming(lambda: (traj for traj in self.trajs),
+                chunk_size=300, silent=True)
+        self.assertTrue(np.allclose(gen_model.xu_std, xu_std))
+        # A generator would be exhausted by the statistics pass
+        with self.assertRaises(TypeError):
+            self.make_model().train_streaming((traj for traj in self.trajs),
+                    chunk_size=300, silent=True)
+
+        model = self.make_model()
+        model.train(self.trajs, silent=True)
+        self.assertLess(stream_rmse, 2 * get_model_rmse(model, self.holdout))
+
+    def test_pred_diff_batch(self):
+        rng = np.random.default_rng(0)
+        states = rng.uniform(-1, 1, (8, 2))
+        ctrls = rng.uniform(-1, 1, (8, 1))
+        for nonlintype in ["relu", "tanh", "sigmoid", "selu"]:
+            model = self.make_model(nonlintype=nonlintype)
+            model.train(self.trajs[:5], silent=True)
+            preds, state_jacs, ctrl_jacs = model.pred_diff_batch(states, ctrls)
+            self.assertTrue(np.allclose(preds, model.pred_batch(states, ctrls)))
+            for i in range(len(states)):
+                xu = torch.from_numpy(np.concatenate([states[i], ctrls[i]]))
+                def func(xu):
+                    xut = (xu - torch.from_numpy(model.xu_means)) / torch.from_numpy(model.xu_std)
+                    return model.net(xut) * torch.from_numpy(model.dy_std) + xu[:2]
+                jac = torch.autograd.functional.jacobian(func, xu).numpy()
+                self.assertTrue(np.allclose(state_jacs[i], jac[:, :2]))
+                self.assertTrue(np.allclose(ctrl_jacs[i], jac[:, 2:]))
+            pred, state_jac, ctrl_jac = model.pred_diff(states[0], ctrls[0])
+            self.assertTrue(np.allclose(pred, preds[0]))
+            self.assertTrue(np.allclose(state_jac, state_jacs[0]))
+
+    def test_train_epoch(self):
+        # Whole-tensor batching takes the same steps as a DataLoader which
+        # visits the samples in the same order
+        model = self.make_model()
+        model.train(self.trajs[:5], silent=True)
+        X, U, Xnext = TrajectorySet.from_trajs(self.trajs).transitions
+        XUt = (np.concatenate([X, U], axis=1) - model.xu_means) / model.xu_std
+        dYt = (Xnext - X - model.dy_means) / model.dy_std
+        n_batch = 64
+        lossfun = torch.nn.SmoothL1Loss()
+        for param in model.net.parameters():
+            param.requires_grad_(True)
+        ref_net = copy.deepcopy(model.net)
+
+        torch.manual_seed(0)
+        perm = torch.randperm(len(XUt)).tolist()
+        dataloader = DataLoader(SimpleDataset(XUt, dYt), batch_size=n_batch,
+                sampler=perm)
+        optim = torch.optim.Adam(ref_net.parameters(), lr=1e-3)
+        for x, y in dataloader:
+            optim.zero_grad()
+            loss = lossfun(ref_net(x), y)
+            loss.backward()
+            optim.step()
+
+        torch.manual_seed(0)
+        optim = torch.optim.Adam(model.net.parameters(), lr=1e-3)
+        model._train_epoch(torch.from_numpy(XUt), torch.from_numpy(dYt),
+                n_batch, optim, lossfun)
+        for param, ref_param in zip(model.net.parameters(), ref_net.parameters()):
+            self.assertTrue(torch.allclose(param, ref_param))
+
+    def test_precision(self):
+        model64 = self.make_model()
+        model64.train(self.trajs, silent=True)
+        model32 = self.make_model(precision="float32")
+        model32.train(self.trajs, silent=True)
+        self.assertEqual(next(model32.net.parameters()).dtype, torch.float32)
+        self.assertEqual(model32.pred_batch(self.holdout[0].obs, 
+            self.holdout[0].ctrls).dtype, np.float64)
+        # Training happens in float64 either way, so only inference differs
+        rmse64 = get_model_rmse(model64, self.holdout)
+        rmse32 = get_model_rmse(model32, self.holdout)
+        self.assertLess(abs(rmse32 - rmse64), 1e-3 * rmse64)
+        with self.assertRaises(ValueError):
+            self.make_model(precision="float16")
+
+    def test_jit(self):
+        model = self.make_model()
+        model.train(self.trajs, silent=True)
+        jit_model = self.make_model(jit=True)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", FutureWarning)
+            jit_model.train(self.trajs, silent=True)
+        self.assertIsNotNone(jit_model._compiled)
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        self.assertTrue(np.allclose(jit_model.pred_batch(obs, ctrls),
+            model.pred_batch(obs, ctrls)))
+        for i in range(len(obs)):
+            self.assertTrue(np.allclose(jit_model.pred(obs[i], ctrls[i]),
+                model.pred(obs[i], ctrls[i])))
+
+    def test_export(self):
+        rng = np.random.default_rng(0)
+        states = rng.uniform(-1, 1, (8, 2))
+        ctrls = rng.uniform(-1, 1, (8, 1))
+        for nonlintype in ["relu", "tanh", "sigmoid", "selu"]:
+            model = self.make_model(nonlintype=nonlintype)
+            model.train(self.trajs[:5], silent=True)
+            np_model = pickle.loads(pickle.dumps(model.export()))
+            self.assertIsInstance(np_model, NumpyMLP)
+            self.assertTrue(np.allclose(np_model.pred_batch(states, ctrls),
+                model.pred_batch(states, ctrls)))
+            preds, state_jacs, ctrl_jacs = model.pred_diff_batch(states, ctrls)
+            np_preds, np_state_jacs, np_ctrl_jacs = np_model.pred_diff_batch(
+                    states, ctrls)
+            self.assertTrue(np.allclose(np_preds, preds))
+            self.assertTrue(np.allclose(np_state_jacs, state_jacs))
+            self.assertTrue(np.allclose(np_ctrl_jacs, ctrl_jacs))
+            for i in range(len(states)):
+                self.assertTrue(np.allclose(np_model.pred(states[i], ctrls[i]),
+                    preds[i]))
+                pred, state_jac, ctrl_jac = np_model.pred_diff(states[i], ctrls[i])
+                self.assertTrue(np.allclose(pred, preds[i]))
+                self.assertTrue(np.allclose(state_jac, state_jacs[i]))
+                self.assertTrue(np.allclose(ctrl_jac, ctrl_jacs[i]))
+
+    def test_export_without_torch(self):
+        model = self.make_model()
+        model.train(self.trajs[:5], silent=True)
+        states = np.zeros((1, 2))
+        ctrls = np.zeros((1, 1))
+        expected = model.pred_batch(states, ctrls)
+        script = ("import json, pickle, sys\n"
+                "import numpy as np\n"
+                "with open(sys.argv[1], 'rb') as f:\n"
+                "    model = pickle.load(f)\n"
+                "assert 'torch' not in sys.modules\n"
+                "print(json.dumps(model.pred_batch(np.zeros((1, 2)), np.zeros((1, 1)))[0].tolist()))\n")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.TemporaryDirectory() as path:
+            fn = os.path.join(path, "model.pkl")
+            with open(fn, "wb") as f:
+                pickle.dump(model.export(), f)
+            result = subprocess.run([sys.executable, "-c", script, fn], cwd=root,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        pred = json.loads(result.stdout.strip().splitlines()[-1])
+        self.assertTrue(np.allclose(pred, expected[0]))
@@ -0,0 +1,75 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import RFFGP, RFFGPFactory
+from autompc.evaluation.model_metrics import get_model_rmse
+
+# External library includes
+import numpy as np
+
+from .test_mlp import uniform_random_generate
+
+class RFFGPTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=40)
+        self.holdout = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=5)
+        self.model = RFFGP(self.system, num_features=200, lengthscale=2.0)
+        self.model.train(self.trajs)
+
+    def test_train(self):
+        baseline = np.sqrt(np.mean([np.sum((traj.obs[1:] - traj.obs[:-1])**2, axis=1)
+            for traj in self.holdout]))
+        self.assertLess(get_model_rmse(self.model, self.holdout), 0.1 * baseline)
+        # Streaming from a generator in small chunks gives the same fit
+        model = RFFGP(self.system, num_features=200, lengthscale=2.0,
+                stream_chunk_size=100)
+        model.train(lambda: iter(self.trajs))
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        self.assertTrue(np.allclose(model.pred_batch(obs, ctrls),
+            self.model.pred_batch(obs, ctrls)))
+        # The data is read twice, so a bare generator is rejected
+        with self.assertRaises(TypeError):
+            model.train(traj for traj in self.trajs)
+
+    def test_pred_diff_batch(self):
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        preds, state_jacs, ctrl_jacs = self.model.pred_diff_batch(obs, ctrls)
+        self.assertTrue(np.allclose(preds, self.model.pred_batch(obs, ctrls)))
+        self.assertTrue(np.allclose(self.model.pred(obs[0], ctrls[0]), preds[0]))
+        eps = 1e-6
+        for i in range(2):
+            step = eps * np.eye(2)[i]
+            fd = (self.model.pred_batch(obs + step, ctrls)
+                    - self.model.pred_batch(obs - step, ctrls)) / (2 * eps)
+            self.assertTrue(np.allclose(state_jacs[:, :, i], fd, atol=1e-6))
+        fd = (self.model.pred_batch(obs, ctrls + eps)
+                - self.model.pred_batch(obs, ctrls - eps)) / (2 * eps)
+        self.assertTrue(np.allclose(ctrl_jacs[:, :, 0], fd, atol=1e-6))
+
+    def test_pred_mean_std(self):
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        mean, std = self.model.pred_mean_std(obs, ctrls)
+        self.assertTrue(np.allclose(mean, self.model.pred_batch(obs, ctrls)))
+        # Uncertainty grows away from the training data
+        far_mean, far_std = self.model.pred_mean_std(obs + 100.0, ctrls)
+        self.assertTrue(np.all(std > 0))
+        self.assertTrue(np.all(far_std > std))
+
+    def test_factory(self):
+        factory = RFFGPFactory(self.system, seed=1)
+        cs = factory.get_configuration_space()
+        model = factory(cs.get_default_configuration(), self.trajs)
+        self.assertEqual(model.num_features, 500)
+        params = model.get_parameters()
+        copy = RFFGP(self.system)
+        copy.set_parameters(params)
+        obs, ctrls = self.holdout[0].obs, self.holdout[0].ctrls
+        self.assertTrue(np.allclose(copy.pred_batch(obs, ctrls),
+            model.pred_batch(obs, ctrls)))
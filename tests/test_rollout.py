@@ -0,0 +1,87 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid import ARXFactory, KoopmanFactory, MLP, EnsembleMLP
+from autompc.sysid.model import Model, LinearRollout
+from autompc.evaluation.model_metrics import get_model_rmse
+
+# External library includes
+import numpy as np
+
+from .test_mlp import uniform_random_generate
+
+def loop_rollout(model, init_states, ctrl_seqs):
+    states = [init_states]
+    for k in range(ctrl_seqs.shape[1]):
+        states.append(model.pred_batch(states[-1], ctrl_seqs[:,k,:]))
+    return np.stack(states, axis=1)
+
+class RolloutTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        rng = np.random.default_rng(42)
+        self.trajs = uniform_random_generate(self.system, rng, traj_len=50,
+                n_trajs=20)
+        self.holdout = uniform_random_generate(self.system, rng, traj_len=30,
+                n_trajs=3)
+        self.ctrl_seqs = rng.uniform(-1, 1, (6, 10, 1))
+
+    def check_rollout(self, model):
+        init_states = np.stack([model.traj_to_state(traj[:5]) 
+            for traj in self.holdout] * 2)
+        states = model.rollout(init_states, self.ctrl_seqs)
+        self.assertEqual(states.shape, (6, 11, model.state_dim))
+        self.assertTrue(np.allclose(states, 
+            loop_rollout(model, init_states, self.ctrl_seqs)))
+        self.assertTrue(np.allclose(states,
+            Model.rollout(model, init_states, self.ctrl_seqs)))
+
+        # Multi-step RMSE agrees with stepping through pred_batch
+        horizon = 3
+        sqerrs = []
+        for traj in self.holdout:
+            state = model.traj_to_states(traj[:-horizon]) \
+                    if hasattr(model, "traj_to_states") else traj.obs[:-horizon]
+            for k in range(horizon):
+                state = model.pred_batch(state, traj.ctrls[k:-(horizon-k)])
+            sqerrs.append((state[:,:2] - traj.obs[horizon:])**2)
+        rmse = np.sqrt(np.mean(np.concatenate(sqerrs)) * 2)
+        self.assertTrue(np.isclose(get_model_rmse(model, self.holdout,
+            horizon=horizon), rmse))
+
+    def test_linear(self):
+        for factory in [ARXFactory(self.system), KoopmanFactory(self.system)]:
+            cfg = factory.get_configuration_space().get_default_configuration()
+            self.check_rollout(factory(cfg, self.trajs))
+
+    def test_mlp(self):
+        for model in [MLP(self.system, n_hidden_layers=2, hidden_size=32,
+                    n_train_iters=2, use_cuda=False),
+                MLP(self.system, n_hidden_layers=2, hidden_size=32,
+                    n_train_iters=2, use_cuda=False, jit=True),
+                EnsembleMLP(self.system, n_hidden_layers=2, hidden_size=32,
+                    n_train_iters=2, use_cuda=False, n_members=3)]:
+            model.train(self.trajs, silent=True)
+            self.check_rollout(model)
+
+    def test_linear_rollout(self):
+        rng = np.random.default_rng(0)
+        A = 0.3 * rng.normal(size=(5, 5))
+        B = rng.normal(size=(5, 2))
+        init_states = rng.normal(size=(50, 5))
+        ctrl_seqs = rng.normal(size=(50, 15, 2))
+        expected = [init_states]
+        for k in range(15):
+            expected.append(expected[-1] @ A.T + ctrl_seqs[:,k,:] @ B.T)
+        expected = np.stack(expected, axis=1)
+
+        engine = LinearRollout(A, B)
+        self.assertTrue(engine.use_closed_form(50, 15))
+        self.assertTrue(np.allclose(engine(init_states, ctrl_seqs), expected))
+        self.assertIs(engine.get_maps(15), engine.get_maps(15))
+        engine.step_overhead = 0
+        self.assertFalse(engine.use_closed_form(50, 15))
+        self.assertTrue(np.allclose(engine(init_states, ctrl_seqs), expected))
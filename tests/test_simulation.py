@@ -0,0 +1,90 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+import autompc as ampc
+from autompc.sysid.dummy_linear import DummyLinear
+from autompc.costs import QuadCost
+from autompc.tasks import Task
+from autompc.control import FiniteHorizonLQR
+from autompc.utils import simulate, simulate_batch, simulate_parallel
+
+# External library includes
+import numpy as np
+
+def dt_doubleint_dynamics(y, u, dt=0.05):
+    return np.array([y[0] + dt * y[1], y[1] + dt * u[0]])
+
+class SimulationTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        self.system.dt = 0.05
+        A = np.array([[1.0, 0.05], [0.0, 1.0]])
+        B = np.array([[0.0], [0.05]])
+        self.model = DummyLinear(self.system, A, B)
+
+        cost = QuadCost(self.system, np.eye(2), np.eye(1), np.eye(2), goal=[0,0])
+        self.task = Task(self.system)
+        self.task.set_cost(cost)
+        self.task.set_ctrl_bound("u", -20.0, 20.0)
+        self.task.set_num_steps(50)
+
+        rng = np.random.default_rng(42)
+        self.init_obs = rng.uniform(-1, 1, (5, 2))
+
+    def make_controller(self, i=None):
+        return FiniteHorizonLQR(self.system, self.task, self.model, horizon=10)
+
+    def test_simulate(self):
+        controller = self.make_controller()
+        traj = simulate(controller, self.init_obs[0], self.task.term_cond,
+                sim_model=self.model, silent=True)
+        self.assertEqual(len(traj), 50)
+        self.assertTrue(np.array_equal(traj[0].obs, self.init_obs[0]))
+        self.assertTrue(np.array_equal(traj[-1].ctrl, np.zeros(1)))
+        for t in range(len(traj)-1):
+            self.assertTrue(np.allclose(traj[t+1].obs,
+                self.model.pred(traj[t].obs, traj[t].ctrl)))
+
+    def test_simulate_max_steps(self):
+        controller = self.make_controller()
+        traj = simulate(controller, self.init_obs[0], sim_model=self.model,
+                max_steps=20, silent=True)
+        self.assertEqual(len(traj), 21)
+
+    def test_simulate_batch(self):
+        trajs = simulate_batch(self.make_controller, self.init_obs,
+                self.task.term_cond, sim_model=self.model, silent=True)
+        self.assertEqual(len(trajs), len(self.init_obs))
+        for init_obs, traj in zip(self.init_obs, trajs):
+            expected = simulate(self.make_controller(), init_obs,
+                    self.task.term_cond, sim_model=self.model, silent=True)
+            self.assertEqual(traj, expected)
+
+    def test_simulate_batch_term_cond(self):
+        # Rollouts which terminate early should stop advancing
+        term_cond = lambda traj: abs(traj[-1].obs[0]) < 0.5 or len(traj) >= 30
+        trajs = simulate_batch(self.make_controller, self.init_obs,
+                term_cond, dynamics=dt_doubleint_dynamics, silent=True)
+        for init_obs, traj in zip(self.init_obs, trajs):
+            expected = simulate(self.make_controller(), init_obs, term_cond,
+                    dynamics=dt_doubleint_dynamics, silent=True)
+            self.assertEqual(traj, expected)
+
+    def test_simulate_parallel(self):
+        controller = self.make_controller()
+        trajs, costs = simulate_parallel(controller, self.task, self.init_obs,
+                sim_model=self.model, num_workers=2)
+        serial_trajs, serial_costs = simulate_parallel(controller, self.task,
+                self.init_obs, sim_model=self.model, num_workers=1)
+        self.assertEqual(len(trajs), len(self.init_obs))
+        self.assertTrue(np.allclose(costs, serial_costs))
+        for traj, serial_traj in zip(trajs, serial_trajs):
+            self.assertEqual(traj, serial_traj)
+        cost = self.task.get_cost()
+        for traj, c in zip(trajs, costs):
+            self.assertAlmostEqual(cost(traj), c)
+
+    def test_exports(self):
+        self.assertIs(ampc.simulate_batch, simulate_batch)
+        self.assertIs(ampc.simulate_parallel, simulate_parallel)
@@ -0,0 +1,39 @@
+# Standard library includes
+import unittest
+
+# Internal library includes
+from autompc.sysid import Standardizer
+
+# External library includes
+import numpy as np
+
+class StandardizerTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.data = rng.normal(loc=[1.0, -2.0, 5.0], scale=[0.5, 3.0, 10.0],
+                size=(100, 3))
+        self.scaler = Standardizer.fit(self.data)
+
+    def test_transform(self):
+        data_t = self.scaler.transform(self.data)
+        self.assertTrue(np.allclose(np.mean(data_t, axis=0), 0.0))
+        self.assertTrue(np.allclose(np.std(data_t, axis=0), 1.0))
+        self.assertTrue(np.allclose(self.scaler.inverse_transform(data_t),
+            self.data))
+        buf = self.data.copy()
+        out = self.scaler.transform(buf, out=buf)
+        self.assertIs(out, buf)
+        self.assertTrue(np.allclose(out, data_t))
+
+    def test_fold(self):
+        rng = np.random.default_rng(1)
+        weight, bias = rng.normal(size=(4, 3)), rng.normal(size=4)
+        fold_weight, fold_bias = self.scaler.fold_input(weight, bias)
+        self.assertTrue(np.allclose(self.data @ fold_weight.T + fold_bias,
+            self.scaler.transform(self.data) @ weight.T + bias))
+
+        hidden = rng.normal(size=(10, 4))
+        weight, bias = rng.normal(size=(3, 4)), rng.normal(size=3)
+        fold_weight, fold_bias = self.scaler.fold_output(weight, bias)
+        self.assertTrue(np.allclose(hidden @ fold_weight.T + fold_bias,
+            self.scaler.inverse_transform(hidden @ weight.T + bias)))
@@ -0,0 +1,117 @@
+# Standard library includes
+import os
+import unittest
+import tempfile
+
+# Internal library includes
+import autompc as ampc
+from autompc import TrajectorySet, save_trajectory_set, load_trajectory_set
+from autompc.sysid import ARXFactory
+
+# External library includes
+import numpy as np
+
+def make_trajs(system, rng, lengths):
+    trajs = []
+    for length in lengths:
+        traj = ampc.zeros(system, length)
+        traj.obs[:] = rng.normal(size=(length, system.obs_dim))
+        traj.ctrls[:] = rng.normal(size=(length, system.ctrl_dim))
+        trajs.append(traj)
+    return trajs
+
+class TrajectorySetTest(unittest.TestCase):
+    def setUp(self):
+        self.system = ampc.System(["x", "y"], ["u"])
+        rng = np.random.default_rng(42)
+        self.trajs = make_trajs(self.system, rng, [10, 1, 25, 7])
+        self.trajset = TrajectorySet.from_trajs(self.trajs)
+
+    def test_indexing(self):
+        self.assertEqual(len(self.trajset), len(self.trajs))
+        for traj, set_traj in zip(self.trajs, self.trajset):
+            self.assertEqual(traj, set_traj)
+        self.assertEqual(self.trajset[-1], self.trajs[-1])
+        self.assertEqual(self.trajset[1:3], self.trajs[1:3])
+        # Trajectories are views into the set
+        self.assertTrue(np.shares_memory(self.trajset[2].obs, self.trajset.obs))
+        with self.assertRaises(IndexError):
+            self.trajset[len(self.trajs)]
+
+    def test_transitions(self):
+        X, U, Xnext = self.trajset.transitions
+        self.assertTrue(np.array_equal(X,
+            np.concatenate([traj.obs[:-1] for traj in self.trajs])))
+        self.assertTrue(np.array_equal(U,
+            np.concatenate([traj.ctrls[:-1] for traj in self.trajs])))
+        self.assertTrue(np.array_equal(Xnext,
+            np.concatenate([traj.obs[1:] for traj in self.trajs])))
+        self.assertEqual(self.trajset.num_transitions,
+                sum(len(traj) - 1 for traj in self.trajs))
+
+    def test_stats(self):
+        X, U, Xnext = self.trajset.transitions
+        xu_means, xu_std, dy_means, dy_std = self.trajset.get_transition_stats()
+        XU = np.concatenate([X, U], axis=1)
+        self.assertTrue(np.allclose(xu_means, np.mean(XU, axis=0)))
+        self.assertTrue(np.allclose(xu_std, np.std(XU, axis=0)))
+        self.assertTrue(np.allclose(dy_means, np.mean(Xnext - X, axis=0)))
+        self.assertTrue(np.allclose(dy_std, np.std(Xnext - X, axis=0)))
+
+        mean, cov = self.trajset.get_obs_stats()
+        obs = np.concatenate([traj.obs for traj in self.trajs])
+        self.assertTrue(np.allclose(mean, np.mean(obs, axis=0)))
+        self.assertTrue(np.allclose(cov, np.cov(obs, rowvar=0)))
+
+    def test_train_model(self):
+        factory = ARXFactory(self.system)
+        cfg = factory.get_configuration_space().get_default_configuration()
+        model_list = factory(cfg, self.trajs)
+        model_set = factory(cfg, self.trajset)
+        self.assertTrue(np.allclose(model_list.A, model_set.A))
+        self.assertTrue(np.allclose(model_list.B, model_set.B))
+
+    def test_train_arx_streaming(self):
+        factory = ARXFactory(self.system)
+        cfg = factory.get_configuration_space().get_default_configuration()
+        model = factory(cfg, self.trajs)
+        stream_factory = ARXFactory(self.system, stream_chunk_size=12)
+        stream_model = stream_factory(cfg, self.trajset)
+        self.assertTrue(np.allclose(model.A, stream_model.A))
+        self.assertTrue(np.allclose(model.B, stream_model.B))
+        params = stream_model.get_parameters()
+        model.set_parameters(params)
+        self.assertTrue(np.allclose(model.A, stream_model.A))
+
+    def test_iter_transitions(self):
+        X, U, Xnext = self.trajset.transitions
+        chunks = list(self.trajset.iter_transitions(chunk_size=8))
+        self.assertEqual(len(chunks), int(np.ceil(len(X) / 8)))
+        self.assertTrue(np.array_equal(X, np.concatenate([c[0] for c in chunks])))
+        self.assertTrue(np.array_equal(U, np.concatenate([c[1] for c in chunks])))
+        self.assertTrue(np.array_equal(Xnext, np.concatenate([c[2] for c in chunks])))
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as path:
+            save_trajectory_set(path, self.trajs)
+            trajset = load_trajectory_set(path)
+            self.assertIsInstance(trajset.obs, np.memmap)
+            self.assertEqual(trajset.system, self.system)
+            self.assertEqual(len(trajset), len(self.trajs))
+            for traj, set_traj in zip(self.trajs, trajset):
+                self.assertEqual(traj, set_traj)
+
+            trajset = load_trajectory_set(path, mmap=False, system=self.system)
+            self.assertNotIsInstance(trajset.obs, np.memmap)
+            self.assertTrue(np.array_equal(trajset.obs, self.trajset.obs))
+            with self.assertRaises(ValueError):
+                load_trajectory_set(path, system=ampc.System(["a", "b"], ["u"]))
+            # Labels come back from JSON as lists
+            system = ampc.System(tuple(self.system.observations),
+                    tuple(self.system.controls))
+            trajset = load_trajectory_set(path, system=system)
+            self.assertIs(trajset.system, system)
+            with open(os.path.join(path, "obs.npy"), "rb") as f:
+                np.lib.format.read_magic(f)
+                shape = np.lib.format.read_array_header_1_0(f)[0]
+            self.assertIs(type(shape[0]), int)